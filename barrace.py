@@ -0,0 +1,304 @@
+"""
+GENERAL INFORMATION
+
+Name: barrace.py
+
+Description: Animates how countries rank on a statistic over time as a "bar chart race": a horizontal bar graph of the
+top countries on each date, saved as a GIF or video. Reads from a TimeSeriesStore (see timeseries.py).
+
+The graph is drawn once. Each frame only updates the bars' lengths and colours and the labels, and redraws just those
+artists over a saved copy of the background (blitting), rather than drawing a new graph per date. Each finished frame
+is written straight to the output file, so memory use doesn't grow with the number of frames.
+
+Frames are written as:
+
+    .gif                  with Pillow, one frame at a time
+    .mp4, .webm, .mkv     with ffmpeg (which must be installed), through a pipe
+
+By default the x-axis is fixed to the largest value in the whole animation, which lets every frame be blitted. With
+'rescale' the x-axis follows the largest value on each date instead, and each frame is drawn in full.
+
+Usage:
+
+    python barrace.py --source sourcedata/owid-covid-data.csv --stat total_cases_per_million --output race.gif
+
+Testing: Example function calls are provided at the bottom to test code functionality.
+
+"""
+
+
+import argparse
+import subprocess
+import sys
+
+import profiler as prof
+import timeseries as ts
+import visualizers as vs
+from lazyimport import lazy_import
+
+# Imported the first time an animation is drawn (see lazyimport.py)
+np = lazy_import('numpy')
+plt = lazy_import('matplotlib.pyplot')
+matplotlib = lazy_import('matplotlib')
+Image = lazy_import('PIL.Image')
+GifImagePlugin = lazy_import('PIL.GifImagePlugin')
+
+
+# Countries shown on each frame, and frames per second
+TOP_COUNTRIES = 10
+FRAMES_PER_SECOND = 10
+
+# File extensions written with ffmpeg
+VIDEO_FORMATS = ('mp4', 'webm', 'mkv')
+
+
+""" Frame Writers """
+
+
+class GifWriter:
+
+    # Writes frames to a looping GIF file as they arrive. Each frame gets its own palette of up to 256 colours
+    def __init__(self, output, fps):
+        self.file = open(output, 'wb')
+        self.duration = int(round(1000 / fps))
+        self.started = False
+
+    # Takes a frame as an array of RGBA pixels
+    def write(self, pixels):
+
+        frame = Image.fromarray(pixels[:, :, :3]).quantize(256, method=Image.Quantize.FASTOCTREE)
+
+        if not self.started:
+            header, palette = GifImagePlugin.getheader(frame, info={'loop': 0, 'duration': self.duration})
+            for block in header:
+                self.file.write(block)
+            self.started = True
+
+        for block in GifImagePlugin.getdata(frame, duration=self.duration):
+            self.file.write(block)
+
+    def close(self):
+
+        # End of the GIF file
+        self.file.write(b';')
+        self.file.close()
+
+
+class VideoWriter:
+
+    # Pipes frames to ffmpeg as raw pixels, which encodes them into a video file as they arrive
+    def __init__(self, output, fps, width, height):
+
+        command = [matplotlib.rcParams['animation.ffmpeg_path'], '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', str(width) + 'x' + str(height), '-r', str(fps),
+                   '-i', '-',
+                   '-pix_fmt', 'yuv420p', output]
+
+        try:
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        except FileNotFoundError:
+            raise RuntimeError("ffmpeg is needed to save videos, save a .gif instead")
+
+    def write(self, pixels):
+        self.process.stdin.write(pixels.tobytes())
+
+    def close(self):
+        self.process.stdin.close()
+
+        if self.process.wait() != 0:
+            raise RuntimeError("ffmpeg could not write the video")
+
+
+# Opens the writer for an output file, chosen by its extension
+def open_writer(output, fps, width, height):
+
+    extension = output.rsplit('.', 1)[-1].lower()
+
+    if extension == 'gif':
+        return GifWriter(output, fps)
+
+    if extension in VIDEO_FORMATS:
+        return VideoWriter(output, fps, width, height)
+
+    raise ValueError("Unsupported animation format '" + extension + "', use gif or one of " + str(VIDEO_FORMATS))
+
+
+""" Animation """
+
+
+# Returns the dates of the frames, and a table of each country's latest value of a statistic on each of those dates
+# (a row per frame, a column per country). A country's value carries forward over dates it has no data for
+def race_values(store, stat, iso_codes=None, start_date=None, end_date=None, step_days=1):
+
+    if iso_codes is None:
+        iso_codes = store.iso_codes()
+
+    first = np.datetime64(start_date, 'D') if start_date is not None else store.dates.min()
+    last = np.datetime64(end_date, 'D') if end_date is not None else store.dates.max()
+    frame_dates = np.arange(first, last + 1, step_days)
+
+    values = np.full((len(frame_dates), len(iso_codes)), np.nan)
+    stat_values = store.dataframe[stat].to_numpy(dtype=float, na_value=np.nan)
+
+    for column, iso_code in enumerate(iso_codes):
+        start, end = store.blocks[iso_code]
+        country_values = stat_values[start:end]
+
+        # Carry each observation forward, so a missing value doesn't make a country drop out for a day
+        observed = np.flatnonzero(~np.isnan(country_values))
+        if len(observed) == 0:
+            continue
+
+        observed_dates = store.dates[start:end][observed]
+
+        # The latest observation on or before each frame's date, found for every frame with one binary search
+        latest = np.searchsorted(observed_dates, frame_dates, side='right') - 1
+        has_value = latest >= 0
+        values[has_value, column] = country_values[observed][latest[has_value]]
+
+    return frame_dates, values
+
+
+# Animates the top countries of a statistic over time, and saves the animation to a GIF or video file. Returns how many
+# frames were written
+def stat_race(store, stat, output, top=TOP_COUNTRIES, iso_codes=None, start_date=None, end_date=None, step_days=1,
+              fps=FRAMES_PER_SECOND, rescale=False):
+
+    if iso_codes is None:
+        iso_codes = store.iso_codes()
+
+    with prof.span('slice'):
+        frame_dates, values = race_values(store, stat, iso_codes, start_date, end_date, step_days)
+        labels = np.array([str(iso_code) for iso_code in iso_codes])
+
+    with prof.span('plot'):
+        figure, axes = plt.subplots(figsize=(8, 5))
+
+        # One colour per country, so a bar keeps its colour as it moves up and down the ranking
+        colours = plt.get_cmap('tab20')(np.arange(len(iso_codes)) % 20)
+
+        # The bars and labels are created once, with the highest rank at the top, and reused for every frame
+        positions = np.arange(top)[::-1]
+        bars = axes.barh(positions, np.zeros(top), height=0.8)
+        # Each bar is labelled with its country and value at its end. Text is the slowest part of a frame to draw,
+        # so each bar gets a single label
+        labels_drawn = [axes.text(0, position, '', ha='left', va='center', fontsize=9) for position in positions]
+        date_label = axes.text(0.98, 0.05, '', transform=axes.transAxes, ha='right', fontsize=16, color='grey')
+
+        axes.set_yticks([])
+        axes.set_ylim(-0.6, top - 0.4)
+        axes.set_xlim(0, max_value(values) * 1.1)
+
+        y_axis_label = stat.title().replace("_", " ")
+        axes.set_xlabel(y_axis_label)
+        axes.set_title(y_axis_label + ": Top " + str(top) + " Countries")
+
+        moving_artists = list(bars) + labels_drawn + [date_label]
+        for artist in moving_artists:
+            artist.set_animated(True)
+
+        canvas = figure.canvas
+        canvas.draw()
+        background = canvas.copy_from_bbox(figure.bbox)
+
+    width, height = canvas.get_width_height()
+    writer = open_writer(output, fps, width, height)
+    offset = axes.get_xlim()[1] * 0.01
+
+    try:
+        with prof.span('render'):
+            for frame, date in enumerate(frame_dates):
+                row = values[frame]
+                ranked = vs.top_k_positions(row, top)
+
+                if rescale:
+                    axes.set_xlim(0, max_value(row) * 1.1)
+                    offset = axes.get_xlim()[1] * 0.01
+
+                # Update the bars in rank order. Ranks without a country (or without data) are left empty
+                for rank in range(top):
+                    if rank < len(ranked) and not np.isnan(row[ranked[rank]]):
+                        country = ranked[rank]
+                        bars[rank].set_width(row[country])
+                        bars[rank].set_color(colours[country])
+                        labels_drawn[rank].set_text(labels[country] + '  ' + format(row[country], ',.6g'))
+                        labels_drawn[rank].set_x(row[country] + offset)
+                    else:
+                        bars[rank].set_width(0)
+                        labels_drawn[rank].set_text('')
+
+                date_label.set_text(str(date))
+
+                # Blit: restore the saved background and redraw only the moving parts. A rescaled axis changes the
+                # background, so it's redrawn in full
+                if rescale:
+                    canvas.draw()
+                    for artist in moving_artists:
+                        axes.draw_artist(artist)
+                else:
+                    canvas.restore_region(background)
+                    for artist in moving_artists:
+                        axes.draw_artist(artist)
+
+                writer.write(np.asarray(canvas.buffer_rgba()))
+
+    finally:
+        writer.close()
+        plt.close(figure)
+
+    return len(frame_dates)
+
+
+# Returns the largest value in an array, ignoring missing values, or 1 if there are none (to keep the axis drawable)
+def max_value(values):
+
+    if np.isnan(values).all():
+        return 1.0
+
+    return max(float(np.nanmax(values)), 1e-9)
+
+
+""" Test Code """
+
+# Test 1: Saves an animation of the 10 countries with the most cases per million, one frame per week of 2021
+# store = ts.TimeSeriesStore.from_csv(stats=['total_cases_per_million'])
+# stat_race(store, 'total_cases_per_million', 'race.gif', start_date='2021-01-01', end_date='2021-12-31', step_days=7)
+
+
+""" Command Line """
+
+
+def parse_arguments(argv):
+
+    parser = argparse.ArgumentParser(description="Animate the top countries of a statistic over time.")
+    parser.add_argument('--source', default="sourcedata/owid-covid-data.csv", help="an OWID csv file with dates")
+    parser.add_argument('--stat', required=True, help="the statistic to rank countries by")
+    parser.add_argument('--output', required=True, help="the GIF or video file to write")
+    parser.add_argument('--top', type=int, default=TOP_COUNTRIES, help="how many countries to show")
+    parser.add_argument('--countries', nargs='+', help="the iso codes to rank (default every country)")
+    parser.add_argument('--start-date', help="the first date, e.g. 2021-01-01")
+    parser.add_argument('--end-date', help="the last date")
+    parser.add_argument('--step-days', type=int, default=1, help="days between frames")
+    parser.add_argument('--fps', type=int, default=FRAMES_PER_SECOND, help="frames per second")
+    parser.add_argument('--rescale', action='store_true', help="fit the x-axis to each date's largest value")
+
+    return parser.parse_args(argv)
+
+
+def main():
+
+    arguments = parse_arguments(sys.argv[1:])
+
+    matplotlib.use('Agg')
+
+    store = ts.TimeSeriesStore.from_csv(arguments.source, [arguments.stat])
+    frames = stat_race(store, arguments.stat, arguments.output, arguments.top, arguments.countries,
+                       arguments.start_date, arguments.end_date, arguments.step_days, arguments.fps, arguments.rescale)
+
+    print(str(frames) + " frames written to " + arguments.output)
+
+
+if __name__ == "__main__":
+    main()
+
+
@@ -0,0 +1,355 @@
+"""
+GENERAL INFORMATION
+
+Name: batchrender.py
+
+Description: Renders the visualizers in visualizers.py without a display, on matplotlib's Agg backend, and saves each
+graph as a PNG or SVG file. Useful for batch jobs on servers, where the interactive 30 second pop-up windows can't be
+used.
+
+A job is a dictionary describing one graph:
+
+    {'visualizer': 'v1',                        # a visualizer key (v1-v5) or function name
+     'args': ['total_deaths', 'USA', 'CAN'],    # arguments after the dataframe, in the visualizer's order
+     'kwargs': {},                              # optional keyword arguments
+     'output': 'charts/usa-can.png'}            # optional output path (the extension picks the format)
+
+A dashboard job draws several jobs as the panels of one image (see visualizers.dashboard):
+
+    {'visualizer': 'dashboard',
+     'args': [[{'visualizer': 'v1', 'args': ['total_deaths', 'USA', 'CAN']},
+               {'visualizer': 'v1', 'args': ['total_cases', 'USA', 'CAN']}]],
+     'kwargs': {'columns': 2, 'title': 'North America'}}
+
+Jobs can also be spread across a pool of worker processes with render_jobs_parallel. The dataframe is saved once as
+a memory-mapped column store (see columnstore.py) which every worker opens, so it is never copied per job.
+
+Testing: Example function calls are provided at the bottom to test code functionality.
+
+"""
+
+
+import importlib
+import inspect
+import io
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import columnstore
+import dataloader as dl
+import profiler as prof
+import rendercache
+import rollup
+import schemas
+import visualizers as vs
+from lazyimport import lazy_import
+
+# Imported the first time a graph is drawn (see lazyimport.py)
+plt = lazy_import('matplotlib.pyplot')
+
+
+# Every visualizer that can be rendered, by key (as used in main.py) and by function name
+VISUALIZERS = vs.VISUALIZERS
+
+# File formats graphs can be saved as
+IMAGE_FORMATS = ('png', 'svg')
+
+
+# Switches matplotlib to the non-interactive Agg backend and stops the visualizers from displaying their graphs
+def start_headless():
+
+    # Choose the backend before pyplot is imported if possible, so no interactive backend is ever loaded
+    if 'matplotlib.pyplot' in sys.modules:
+        plt.switch_backend('Agg')
+    else:
+        importlib.import_module('matplotlib').use('Agg')
+
+    vs.INTERACTIVE = False
+
+
+# Works out the output path and file format of a job
+def job_output(job, job_number, output_dir, image_format):
+
+    output = job.get('output')
+
+    # Name the file after the job's position and visualizer if no path was given
+    if output is None:
+        output = "chart-" + str(job_number) + "-" + job['visualizer'] + "." + image_format
+        output = os.path.join(output_dir, output)
+
+    # The file extension decides the format, falling back on the requested default format
+    extension = os.path.splitext(output)[1][1:].lower()
+    if extension in IMAGE_FORMATS:
+        image_format = extension
+
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError("Unsupported image format '" + image_format + "', use one of " + str(IMAGE_FORMATS))
+
+    return output, image_format
+
+
+# Returns the visualizer function a job asks for
+def job_visualizer(job):
+
+    if job['visualizer'] not in VISUALIZERS:
+        raise ValueError("Unknown visualizer '" + str(job['visualizer']) + "'")
+
+    return VISUALIZERS[job['visualizer']]
+
+
+# Draws a job's graph and saves it to a file path or file-like object
+def draw_job(dataframe, job, destination, image_format, job_number=0):
+
+    visualizer = job_visualizer(job)
+
+    try:
+        with prof.trace(visualizer.__name__, job=job_number, args=job.get('args', []), kwargs=job.get('kwargs', {})):
+            figure = visualizer(dataframe, *job.get('args', []), **job.get('kwargs', {}))
+
+            with prof.span('render'):
+                figure.savefig(destination, format=image_format)
+
+    finally:
+        # Close every figure the job opened so memory doesn't grow across thousands of jobs
+        plt.close('all')
+
+
+# Checks whether a job only graphs continents, so it can be drawn from country data rolled up to continents (see
+# rollup.py) instead of from every country
+def continent_job(job):
+
+    visualizer = job_visualizer(job)
+
+    return visualizer in vs.PANEL_VISUALIZERS and visualizer not in vs.COUNTRY_VISUALIZERS
+
+
+# Works out the only data a job needs from a csv file with the given column names: a list of columns and a filter of
+# key values, for dataloader.load_query. Returns None if the job may need the whole file
+def job_query(job, headers):
+
+    visualizer = job_visualizer(job)
+
+    # Match the job's arguments to the visualizer's parameters by name, however they were given. A job whose arguments
+    # don't fit is left to fail when it's drawn
+    try:
+        named = inspect.signature(visualizer).bind(None, *job.get('args', []), **job.get('kwargs', {}))
+    except TypeError:
+        return None
+
+    named.apply_defaults()
+    named = named.arguments
+
+    if visualizer.__name__ == 'dashboard':
+        return merge_queries([job_query(panel, headers) for panel in named['panels']])
+
+    if visualizer.__name__ == 'comp_infec_between_countries':
+        iso_codes = [named[name] for name in ('iso_code1', 'iso_code2', 'iso_code3') if named[name] is not None]
+        return ['iso_code', named['stat']], {'iso_code': iso_codes}
+
+    if visualizer.__name__ == 'infec_stat_all_countries':
+        return ['iso_code', named['stat']], {}
+
+    # The infections and continents each continent visualizer compares, and its stat
+    stat = named.get('stat')
+
+    if visualizer.__name__ == 'comp_infec_in_continent':
+        infections, continents = [named['infection1'], named['infection2']], [named['continent']]
+    elif visualizer.__name__ == 'comp_infec_between_continents':
+        infections, continents = [named['infection']], [named['continent1'], named['continent2']]
+    elif visualizer.__name__ == 'multi_comp':
+        infections, continents = [named['infec1'], named['infec2']], [named['continent1'], named['continent2']]
+    elif visualizer.__name__ == 'multi_comp_grid':
+        infections, continents = named['infections'], named['continents']
+    else:
+        return None
+
+    # Country data is rolled up to continents from every country (see rollup.py), so no rows can be left out
+    if schemas.detect_family(headers) == 'covid':
+        columns = ['iso_code', 'continent', stat]
+        if rollup.WEIGHT_COLUMN in headers:
+            columns.append(rollup.WEIGHT_COLUMN)
+        return columns, {}
+
+    # Without a list of infections (or continents), every one in the file is graphed, so no rows can be left out
+    if infections is None or continents is None:
+        return ['infection', 'continent', stat], {}
+
+    return ['infection', 'continent', stat], {'infection': infections, 'continent': continents}
+
+
+# Combines the queries of several jobs into one query for every row and column any of them needs, so the data for a
+# dashboard is loaded in one pass. Returns None if any job may need the whole file
+def merge_queries(queries):
+
+    if not queries or any(query is None for query in queries):
+        return None
+
+    columns = []
+    for query_columns, where in queries:
+        columns.extend(column for column in query_columns if column not in columns)
+
+    # Rows are only filtered when every job filters on the same columns. The values of each column are combined,
+    # which may keep a few rows no job needs (e.g. every infection in every continent), but never drops one
+    filters = [where for query_columns, where in queries]
+    if any(where.keys() != filters[0].keys() for where in filters):
+        return columns, {}
+
+    merged = {}
+    for where in filters:
+        for column, values in where.items():
+            merged.setdefault(column, [])
+            merged[column].extend(value for value in values if value not in merged[column])
+
+    return columns, merged
+
+
+# Returns the render cache key of a job drawn from data with the given content hash
+def job_cache_key(job, data_version, image_format):
+    return rendercache.render_key(data_version, job_visualizer(job).__name__, job.get('args', []),
+                                  job.get('kwargs', {}), image_format)
+
+
+# Copies a job's graph out of a render cache (see rendercache.py) if it has been drawn from the same data before.
+# Returns the job's summary, or None if the graph isn't cached
+def fetch_cached_job(cache, data_version, job, job_number=0, output_dir='.', image_format='png'):
+
+    visualizer = job_visualizer(job)
+    output, image_format = job_output(job, job_number, output_dir, image_format)
+
+    start = time.perf_counter()
+
+    if not cache.fetch(job_cache_key(job, data_version, image_format), image_format, output):
+        return None
+
+    seconds = time.perf_counter() - start
+
+    return {'job': job_number, 'visualizer': visualizer.__name__, 'output': output, 'seconds': seconds, 'cached': True}
+
+
+# Renders a single job and saves it to file. Returns a summary of the job, including how long it took to render.
+# If a render cache and the content hash of the data are given, the graph is added to the cache
+def render_job(dataframe, job, job_number=0, output_dir='.', image_format='png', cache=None, data_version=None):
+
+    visualizer = job_visualizer(job)
+    output, image_format = job_output(job, job_number, output_dir, image_format)
+
+    start = time.perf_counter()
+    draw_job(dataframe, job, output, image_format, job_number)
+    seconds = time.perf_counter() - start
+
+    if cache is not None and data_version is not None:
+        cache.store(job_cache_key(job, data_version, image_format), image_format, output)
+
+    return {'job': job_number, 'visualizer': visualizer.__name__, 'output': output, 'seconds': seconds, 'cached': False}
+
+
+# Renders a single job in memory, and returns the image file's contents as bytes
+def render_image(dataframe, job, image_format='png'):
+
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError("Unsupported image format '" + image_format + "', use one of " + str(IMAGE_FORMATS))
+
+    image = io.BytesIO()
+    draw_job(dataframe, job, image, image_format)
+
+    return image.getvalue()
+
+
+# Renders a single job, reporting a failure in the job's summary instead of raising it, so one bad job doesn't stop
+# a whole batch
+def try_render_job(dataframe, job, job_number=0, output_dir='.', image_format='png'):
+    try:
+        return render_job(dataframe, job, job_number, output_dir, image_format)
+
+    except Exception as error:
+        return {'job': job_number, 'visualizer': job.get('visualizer'), 'output': None, 'error': repr(error)}
+
+
+# Renders a list of jobs one after the other. Returns one summary per job, in job order
+def render_jobs(dataframe, jobs, output_dir='.', image_format='png'):
+
+    start_headless()
+
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    # Index the data once for every job
+    dataset = dl.dataset_of(dataframe)
+
+    return [try_render_job(dataset, job, job_number, output_dir, image_format)
+            for job_number, job in enumerate(jobs)]
+
+
+""" Parallel Rendering """
+
+
+# The dataset each worker process renders from. Set once per worker by start_worker
+_worker_dataset = None
+
+
+# Runs once in each worker process: opens the shared column store and switches to headless rendering
+def start_worker(store_directory):
+    global _worker_dataset
+
+    _worker_dataset = dl.Dataset(columnstore.read_columns(store_directory))
+    start_headless()
+
+
+# Renders one job inside a worker process. Takes a (job number, job, output directory, image format) tuple
+def render_worker_job(task):
+
+    job_number, job, output_dir, image_format = task
+
+    return try_render_job(_worker_dataset, job, job_number, output_dir, image_format)
+
+
+# Renders a list of jobs across a pool of worker processes (one per CPU core by default). Returns one summary per
+# job, in job order
+def render_jobs_parallel(dataframe, jobs, output_dir='.', image_format='png', processes=None):
+
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    # Save the dataframe once where every worker can memory-map it
+    store_directory = tempfile.mkdtemp(prefix='infec-render-')
+
+    try:
+        columnstore.write_columns(dl.dataset_of(dataframe).dataframe, store_directory)
+
+        tasks = [(job_number, job, output_dir, image_format) for job_number, job in enumerate(jobs)]
+
+        if processes is None:
+            processes = os.cpu_count() or 1
+
+        # Hand out jobs in small batches to keep the workers busy without a round trip per job
+        chunk_size = max(1, len(tasks) // (processes * 4))
+
+        with multiprocessing.Pool(processes, initializer=start_worker, initargs=(store_directory,)) as pool:
+            return pool.map(render_worker_job, tasks, chunksize=chunk_size)
+
+    finally:
+        shutil.rmtree(store_directory, ignore_errors=True)
+
+
+""" Test Code """
+
+# Data files
+# import pandas as pd
+# covid_df = pd.read_csv('datafiles/covid-data.csv')
+
+# Test 1: Saves a bar graph of total deaths in the United States and Canada, and of the 20 countries with the lowest
+# cases per million, into a 'charts' directory, and prints how long each one took
+# results = render_jobs(covid_df, [{'visualizer': 'v1', 'args': ['total_deaths', 'USA', 'CAN']},
+#                                  {'visualizer': 'v2', 'args': [20, 'total_cases_per_million'],
+#                                   'kwargs': {'bottom': True}, 'output': 'charts/lowest.svg'}], 'charts')
+# print(results)
+
+# Test 2: Saves a bar graph of every statistic for the United States, Canada and Mexico, using every CPU core
+# stats = list(covid_df.columns[4:])
+# results = render_jobs_parallel(covid_df, [{'visualizer': 'v1', 'args': [stat, 'USA', 'CAN', 'MEX']}
+#                                           for stat in stats], 'charts')
+# print(results)
@@ -0,0 +1,354 @@
+"""
+GENERAL INFORMATION
+
+Name: benchmarks.py
+
+Description: Measures how long parts of the program take, so slowdowns can be caught between versions.
+
+Import times: each project module is imported in a fresh Python process, which reports how long the import took and
+which heavy libraries (pandas, numpy, matplotlib) it pulled in. Importing main.py, datatoolslib.py and the other
+modules that don't draw graphs should never import matplotlib, and shouldn't import pandas either (see
+lazyimport.py).
+
+Benchmark suite: generates synthetic files shaped like the raw OWID data (any number of countries, days and columns)
+and the panepi data, then times each stage of the program on them: prune_data, create_iso_dict, available_info,
+loading the data (parsing the csv, and through the dataloader cache) and each of the five visualizers rendered
+headlessly. The timings are printed (or saved) as JSON, so runs can be compared across versions and at different
+sizes to see where each stage stops scaling.
+
+Usage:
+
+    python benchmarks.py imports     # prints the import report as JSON, exits with 1 if a module imports too much
+    python benchmarks.py suite --countries 250 --days 2000 --columns 60 --output bench.json
+
+"""
+
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from lazyimport import lazy_import
+
+# Imported when the benchmark suite runs (see lazyimport.py)
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+
+# Directory holding the project modules
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# Libraries that are too slow to import unless they are actually needed
+HEAVY_MODULES = ('pandas', 'numpy', 'matplotlib', 'matplotlib.pyplot')
+
+# Project modules, and the heavy libraries each one is allowed to import when it is imported
+IMPORT_ALLOWANCES = {'main': (),
+                     'datatoolslib': (),
+                     'dataloader': (),
+                     'columnstore': (),
+                     'timeseries': (),
+                     'visualizers': (),
+                     'batchrender': (),
+                     'chartserver': (),
+                     'rendercache': (),
+                     'rollup': (),
+                     'barrace': ()}
+
+# The longest any project module may take to import, in seconds
+MAX_IMPORT_SECONDS = 0.5
+
+# Run in a fresh Python process to time one import and list the heavy libraries it loaded
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'loaded': [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+""" Import Times """
+
+
+# Imports a module in a fresh Python process. Returns how long the import took, and which heavy libraries it loaded
+def time_import(module):
+
+    probe = IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True, check=True,
+                            cwd=PROJECT_DIR).stdout
+
+    return json.loads(output)
+
+
+# Times the import of every project module, and checks none of them loads a heavy library it isn't allowed to or
+# takes too long
+def check_imports():
+
+    report = {}
+
+    for module, allowed in IMPORT_ALLOWANCES.items():
+        result = time_import(module)
+        result['unexpected'] = [name for name in result['loaded'] if name not in allowed]
+        result['too_slow'] = result['seconds'] > MAX_IMPORT_SECONDS
+        report[module] = result
+
+    return report
+
+
+""" Synthetic Data """
+
+
+# Continents used in the synthetic files
+CONTINENTS = ['Africa', 'Asia', 'Europe', 'North America', 'Oceania', 'South America']
+
+# The first columns of a raw OWID file, as read by data_cleaning.create_csv. Synthetic files add numbered stat columns
+# after these up to the requested number of columns
+OWID_COLUMNS = ['iso_code', 'continent', 'location', 'date', 'total_cases', 'total_deaths', 'total_cases_per_million',
+                'reproduction_rate', 'population', 'population_density', 'gdp_per_capita', 'life_expectancy']
+
+
+# Makes a three letter iso code for the nth synthetic country (AAA, AAB, ...)
+def synthetic_iso_code(number):
+
+    letters = ''
+    for _ in range(3):
+        letters = chr(ord('A') + number % 26) + letters
+        number //= 26
+
+    return letters
+
+
+# Writes a synthetic raw OWID file, one country at a time so memory stays small however large the file is
+def generate_owid(path, countries=250, days=2000, columns=60, seed=0):
+
+    random = np.random.default_rng(seed)
+    dates = pd.date_range('2020-01-01', periods=days).strftime('%Y-%m-%d')
+    extra_columns = ['stat_' + str(number) for number in range(max(0, columns - len(OWID_COLUMNS)))]
+
+    for country in range(countries):
+        population = float(random.integers(100000, 1000000000))
+
+        total_cases = np.cumsum(random.integers(0, 1000, days)).astype(float)
+        total_deaths = np.floor(total_cases * 0.01)
+
+        data = {'iso_code': synthetic_iso_code(country),
+                'continent': CONTINENTS[country % len(CONTINENTS)],
+                'location': 'Country ' + str(country),
+                'date': dates,
+                'total_cases': total_cases,
+                'total_deaths': total_deaths,
+                'total_cases_per_million': total_cases / (population / 1000000),
+                'reproduction_rate': random.uniform(0.5, 2, days).round(2),
+                'population': population,
+                'population_density': round(float(random.uniform(1, 1000)), 3),
+                'gdp_per_capita': round(float(random.uniform(500, 100000)), 3),
+                'life_expectancy': round(float(random.uniform(50, 85)), 2)}
+
+        for column in extra_columns:
+            data[column] = random.normal(100, 10, days).round(3)
+
+        frame = pd.DataFrame(data)[OWID_COLUMNS[:max(columns, 4)] + extra_columns]
+        frame.to_csv(path, mode='w' if country == 0 else 'a', header=country == 0, index=False)
+
+
+# Writes a synthetic file in the panepi format, with a row for every infection in every continent and the world
+def generate_panepi(path, infections=20, seed=0):
+
+    random = np.random.default_rng(seed)
+    locations = CONTINENTS + ['World']
+
+    rows = []
+    for infection in range(infections):
+        for continent in locations:
+            population = float(random.integers(10000000, 5000000000))
+            deaths = float(random.integers(0, 10000000))
+            rows.append(['INFECTION ' + str(infection), continent, round(float(random.uniform(0.1, 10)), 1), deaths,
+                         population, deaths / (population / 1000000)])
+
+    pd.DataFrame(rows, columns=['infection', 'continent', 'duration_in_years', 'est_total_deaths', 'population',
+                                'deaths_per_million']).to_csv(path, index=False)
+
+
+""" Benchmark Suite """
+
+
+# Runs a function the given number of times, and returns the fastest time in seconds and the function's last result
+def time_stage(function, repeat=1):
+
+    best = None
+    result = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        seconds = time.perf_counter() - start
+
+        if best is None or seconds < best:
+            best = seconds
+
+    return best, result
+
+
+# Generates the synthetic files in a temporary directory and times every stage on them. Returns the results as a
+# dictionary that can be saved as JSON
+def run_suite(countries=250, days=2000, columns=60, infections=20, repeat=3):
+
+    import batchrender as br
+    import data_cleaning as dc
+    import dataloader as dl
+    import datatoolslib as dtl
+
+    work_dir = tempfile.mkdtemp(prefix='infec-bench-')
+    previous_dir = os.getcwd()
+    timings = {}
+
+    try:
+        # data_cleaning writes its files into the working directory
+        os.chdir(work_dir)
+        br.start_headless()
+
+        timings['generate_owid'], _ = time_stage(lambda: generate_owid('owid.csv', countries, days, columns))
+        generate_panepi('panepi.csv', infections)
+
+        # Data cleaning
+        timings['prune_data'], country_list = time_stage(lambda: dc.prune_data('owid.csv'))
+        timings['create_csv'], _ = time_stage(lambda: dc.create_csv(country_list), repeat)
+
+        snapshot = pd.read_csv('covid-data.csv')
+        snapshot[['location', 'iso_code']].to_csv('iso-codes.csv', index=False)
+
+        # Iso lookups: the first load of the file, then a lookup against the cached index
+        timings['iso_index_load'], iso_index = time_stage(lambda: dtl.IsoIndex('iso-codes.csv').refresh(), repeat)
+        timings['iso_lookup'], _ = time_stage(lambda: iso_index.iso_code('Country 0'), repeat)
+        timings['create_iso_dict'], _ = time_stage(lambda: dtl.create_iso_dict('iso-codes.csv'), repeat)
+
+        # Typo-tolerant lookups: indexing every country name, then suggesting names for a misspelt one (the first
+        # suggestion also builds the index's BK-tree, so with repeats the fastest run times a search alone)
+        country_names = list(iso_index.by_country)
+        timings['value_index_build'], country_index = time_stage(lambda: dtl.ValueIndex(country_names), repeat)
+        timings['value_suggest'], _ = time_stage(lambda: country_index.suggest('Cuntry 12'), repeat)
+
+        # Loading the data: a plain parse, a first load through the cache, and a cached load
+        timings['read_csv_owid'], owid = time_stage(lambda: pd.read_csv('owid.csv'))
+        timings['load_csv_cold_owid'], _ = time_stage(lambda: dl.load_csv('owid.csv', 'cache'))
+        timings['load_csv_warm_owid'], _ = time_stage(lambda: dl.load_csv('owid.csv', 'cache'), repeat)
+
+        # Loading only what a v1 graph of three countries needs: streamed from the csv file, then from the cache
+        query = (['iso_code', 'total_cases'], {'iso_code': [synthetic_iso_code(number) for number in range(3)]})
+        timings['load_query_stream_owid'], _ = time_stage(lambda: dl.load_query('owid.csv', *query, cache_dir='empty'),
+                                                          repeat)
+        timings['load_query_cached_owid'], _ = time_stage(lambda: dl.load_query('owid.csv', *query, cache_dir='cache'),
+                                                          repeat)
+        timings['load_csv_warm_snapshot'], covid_df = time_stage(lambda: dl.load_csv('covid-data.csv', 'cache'),
+                                                                 repeat)
+        panepi_df = dl.load_csv('panepi.csv', 'cache')
+
+        timings['available_info_headers'], _ = time_stage(lambda: dtl.available_info(owid, 'headers'), repeat)
+        timings['available_info_column'], _ = time_stage(lambda: dtl.available_info(owid, 'continent'), repeat)
+
+        timings['dataset_index_snapshot'], covid_data = time_stage(lambda: dl.Dataset(covid_df), repeat)
+        timings['dataset_index_panepi'], panepi_data = time_stage(lambda: dl.Dataset(panepi_df), repeat)
+
+        # The five visualizers, plus the all-country and every-infection variants
+        iso_codes = [synthetic_iso_code(number) for number in range(min(3, countries))]
+        visualizer_jobs = {'v1': (covid_data, {'visualizer': 'v1', 'args': ['total_cases'] + iso_codes}),
+                           'v2_top20': (covid_data, {'visualizer': 'v2', 'args': [20, 'total_cases_per_million'],
+                                                     'kwargs': {'top': True}}),
+                           'v2_all': (covid_data, {'visualizer': 'v2', 'args': [None, 'total_cases_per_million']}),
+                           'v3': (panepi_data, {'visualizer': 'v3',
+                                                'args': ['Europe', 'INFECTION 0', 'INFECTION 1', 'est_total_deaths']}),
+                           'v4': (panepi_data, {'visualizer': 'v4',
+                                                'args': ['INFECTION 0', 'Africa', 'Asia', 'deaths_per_million']}),
+                           'v5': (panepi_data, {'visualizer': 'v5', 'args': ['INFECTION 0', 'INFECTION 1', 'Africa',
+                                                                             'Asia', 'est_total_deaths']}),
+                           'multi_comp_grid': (panepi_data, {'visualizer': 'multi_comp_grid',
+                                                             'args': ['deaths_per_million']})}
+
+        for name, (dataset, job) in visualizer_jobs.items():
+            job['output'] = name + '.png'
+            timings['render_' + name], _ = time_stage(lambda: br.render_job(dataset, job), repeat)
+
+        # A report of six comparisons: drawn as six separate graphs, then as the panels of one dashboard
+        report_panels = [{'visualizer': 'v1', 'args': [stat] + iso_codes}
+                         for stat in ('total_cases', 'total_deaths', 'total_cases_per_million', 'reproduction_rate')]
+        report_panels += [{'visualizer': 'v4', 'args': ['COVID19', 'Africa', 'Asia', 'total_deaths']},
+                          {'visualizer': 'multi_comp_grid', 'args': ['total_cases_per_million']}]
+
+        report_jobs = [dict(panel, output='panel-' + str(number) + '.png')
+                       for number, panel in enumerate(report_panels)]
+        dashboard_job = {'visualizer': 'dashboard', 'args': [report_panels], 'output': 'dashboard.png'}
+
+        timings['render_report_separate'], _ = time_stage(lambda: [br.render_job(covid_data, job)
+                                                                   for job in report_jobs], repeat)
+        timings['render_report_dashboard'], _ = time_stage(lambda: br.render_job(covid_data, dashboard_job), repeat)
+
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {'config': {'countries': countries, 'days': days, 'columns': columns, 'infections': infections,
+                       'rows': countries * days, 'repeat': repeat},
+            'environment': {'python': platform.python_version(), 'pandas': pd.__version__,
+                            'numpy': np.__version__, 'commit': current_commit()},
+            'seconds': timings}
+
+
+# Returns the git commit being benchmarked, if the project is a git checkout
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=PROJECT_DIR).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+""" Command Line """
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the infection data visualizer.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('imports', help="check import times and which heavy libraries each module imports")
+
+    suite = commands.add_parser('suite', help="time every stage on synthetic OWID-shaped data")
+    suite.add_argument('--countries', type=int, default=250)
+    suite.add_argument('--days', type=int, default=2000)
+    suite.add_argument('--columns', type=int, default=60)
+    suite.add_argument('--infections', type=int, default=20)
+    suite.add_argument('--repeat', type=int, default=3, help="runs per stage (the fastest is kept)")
+    suite.add_argument('--output', help="a JSON file to save the results in (printed if left out)")
+
+    arguments = parser.parse_args(argv)
+
+    if arguments.command == 'suite':
+        results = run_suite(arguments.countries, arguments.days, arguments.columns, arguments.infections,
+                            arguments.repeat)
+
+        if arguments.output is None:
+            print(json.dumps(results, indent=2))
+        else:
+            with open(arguments.output, 'w') as json_file:
+                json.dump(results, json_file, indent=2)
+
+        return 0
+
+    report = check_imports()
+    print(json.dumps(report, indent=2))
+
+    # Fail if any module imported a heavy library it shouldn't have, or was too slow
+    if any(result['unexpected'] or result['too_slow'] for result in report.values()):
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,344 @@
+"""
+GENERAL INFORMATION
+
+Name: chartserver.py
+
+Description: A local HTTP server that renders the visualizers as PNG or SVG images, so graphs can be embedded in
+dashboards without running main.py for each one. Every visualizer is an endpoint, and its inputs are query
+parameters named like the options of main.py:
+
+    /comp_infec_between_countries?stat=total_deaths&countries=USA,CAN
+    /infec_stat_all_countries?stat=total_cases_per_million&sample_size=20&order=high
+    /comp_infec_in_continent?continent=Africa&infections=COVID19,HIV&stat=est_total_deaths
+    /comp_infec_between_continents?infection=COVID19&continents=Africa,Europe&stat=est_total_deaths
+    /multi_comp?infections=COVID19,HIV&continents=Africa,Europe&stat=est_total_deaths&format=svg
+
+The visualizer keys (/v1 to /v5) work as endpoints too. 'data' picks which of the server's csv files to use, and
+defaults to the first file holding the right kind of data (countries for v1 and v2, infections for v3 to v5, or
+countries rolled up to continents if the server has no infection data). 'format' is png (the default) or svg.
+Visiting / lists the endpoints, the data files and the render cache's hit rate.
+
+Graphs are drawn by a pool of worker processes (matplotlib can't draw from several threads at once), which each keep
+the data files loaded between requests. Rendered images are kept in a least recently used cache keyed by the data
+file's content hash, the visualizer and its inputs, so a repeated request is answered without drawing anything, and
+an edited data file is never answered from stale images.
+
+Usage:
+
+    python chartserver.py --data datafiles/covid-data.csv datafiles/panepi-data.csv --port 8000
+
+Only the data files named when the server starts can be used. The server listens on localhost unless told otherwise.
+
+"""
+
+
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import batchrender as br
+import dataloader as dl
+import main as cli
+import schemas
+
+
+# Visualizer endpoints, with the visualizer key each one stands for
+ENDPOINTS = {'comp_infec_between_countries': 'v1',
+             'infec_stat_all_countries': 'v2',
+             'comp_infec_in_continent': 'v3',
+             'comp_infec_between_continents': 'v4',
+             'multi_comp': 'v5'}
+
+for _key in list(ENDPOINTS.values()):
+    ENDPOINTS[_key] = _key
+
+# The families of data files each visualizer works with (see schemas.py), in the order a default file is picked. The
+# continent visualizers can also graph country data, rolled up to continents (see rollup.py)
+DATA_KINDS = {'v1': ('covid',), 'v2': ('covid',), 'v3': ('panepi', 'covid'), 'v4': ('panepi', 'covid'),
+              'v5': ('panepi', 'covid')}
+
+# Query parameters holding a list of values, given as repeated or comma separated values
+LIST_PARAMETERS = ('countries', 'infections', 'continents')
+
+# Content type of each image format
+CONTENT_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+# The most rendered images kept in memory
+CACHE_SIZE = 512
+
+
+class RenderCache:
+
+    # A thread-safe least recently used cache of rendered images, which counts its hits and misses
+    def __init__(self, max_entries=CACHE_SIZE):
+        self.max_entries = max_entries
+        self.images = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # Returns a cached image, or None if it isn't cached
+    def get(self, key):
+        with self.lock:
+            image = self.images.get(key)
+
+            if image is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.images.move_to_end(key)
+
+            return image
+
+    # Caches an image, dropping the least recently used images once the cache is full
+    def put(self, key, image):
+        with self.lock:
+            self.images[key] = image
+            self.images.move_to_end(key)
+
+            while len(self.images) > self.max_entries:
+                self.images.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.images), 'max_entries': self.max_entries, 'hits': self.hits,
+                    'misses': self.misses}
+
+
+class DataFiles:
+
+    # Keeps track of the data files a server may use: what kind of data each holds, and the content hash of each.
+    # A file is only re-hashed when its size or modification time changes
+    def __init__(self, datafiles):
+        self.paths = {}
+        self.kinds = {}
+        self.versions = {}
+        self.lock = threading.Lock()
+
+        for datafile in datafiles:
+            # A file can be asked for by the path it was given as, or by its file name
+            self.paths[datafile] = datafile
+            self.paths.setdefault(os.path.basename(datafile), datafile)
+            self.kinds[datafile] = schemas.detect_family(dl.read_headers(datafile))
+            self.version(datafile)
+
+    # Returns the data file to use for a visualizer, raising a ValueError for a file the server doesn't have
+    def choose(self, name, visualizer):
+
+        if name is not None:
+            if name not in self.paths:
+                raise ValueError("Unknown data file '" + name + "'")
+            return self.paths[name]
+
+        for wanted_kind in DATA_KINDS[visualizer]:
+            for datafile, kind in self.kinds.items():
+                if kind == wanted_kind:
+                    return datafile
+
+        raise ValueError("No data file for visualizer '" + visualizer + "'")
+
+    # Returns the content hash of a data file
+    def version(self, datafile):
+
+        stat = os.stat(datafile)
+        signature = (stat.st_size, stat.st_mtime_ns)
+
+        with self.lock:
+            known = self.versions.get(datafile)
+            if known is not None and known[0] == signature:
+                return known[1]
+
+        content_hash = dl.file_version(datafile)
+
+        with self.lock:
+            self.versions[datafile] = (signature, content_hash)
+
+        return content_hash
+
+
+""" Worker Processes """
+
+
+# The datasets a worker process has loaded, by data file, with the content hash each was loaded from
+_worker_datasets = {}
+
+
+# Runs once in each worker process: switches to headless rendering
+def start_worker():
+    br.start_headless()
+
+
+# Renders one image inside a worker process. Takes a (data file, content hash, job, image format) tuple. The data
+# file is loaded the first time it's used, and again only if its contents change
+def render_worker_image(task):
+
+    datafile, content_hash, job, image_format = task
+
+    loaded = _worker_datasets.get(datafile)
+    if loaded is None or loaded[0] != content_hash:
+        loaded = (content_hash, dl.Dataset(dl.load_csv(datafile)))
+        _worker_datasets[datafile] = loaded
+
+    return br.render_image(loaded[1], job, image_format)
+
+
+""" Server """
+
+
+# Turns a request's query string into the job parameters used by main.py
+def read_query(query, visualizer):
+
+    params = {'visualizer': visualizer}
+
+    for name, values in urllib.parse.parse_qs(query).items():
+        if name in LIST_PARAMETERS:
+            params[name] = [value for combined in values for value in combined.split(',') if value]
+        else:
+            params[name] = values[-1]
+
+    if 'sample_size' in params:
+        try:
+            params['sample_size'] = int(params['sample_size'])
+        except ValueError:
+            raise ValueError("sample_size must be a whole number")
+
+    for name, count in (('infections', 2), ('continents', 2)):
+        if name in params and len(params[name]) != count:
+            raise ValueError(name + " needs exactly " + str(count) + " values")
+
+    return params
+
+
+class ChartServer(ThreadingHTTPServer):
+
+    # Serves graphs of the given data files, drawn by a pool of worker processes
+    def __init__(self, address, datafiles, processes=None, cache_size=CACHE_SIZE):
+        self.datafiles = DataFiles(datafiles)
+        self.cache = RenderCache(cache_size)
+
+        # Bind the socket before starting the workers, so a port that's in use doesn't leave a pool running
+        self.pool = None
+        super().__init__(address, ChartRequestHandler)
+
+        try:
+            self.pool = multiprocessing.Pool(processes or os.cpu_count() or 1, initializer=start_worker)
+        except Exception:
+            self.server_close()
+            raise
+
+    # Returns a graph as image bytes, from the cache if it has been drawn before, along with its format
+    def chart(self, endpoint, query):
+
+        visualizer = ENDPOINTS[endpoint]
+        params = read_query(query, visualizer)
+
+        image_format = params.pop('format', 'png')
+        if image_format not in br.IMAGE_FORMATS:
+            raise ValueError("Unsupported image format '" + image_format + "', use one of " + str(br.IMAGE_FORMATS))
+
+        datafile = self.datafiles.choose(params.pop('data', None), visualizer)
+
+        try:
+            job = cli.build_job(params)
+        except KeyError as error:
+            raise ValueError("Missing parameter " + str(error))
+
+        content_hash = self.datafiles.version(datafile)
+        key = (content_hash, visualizer, json.dumps([job['args'], job['kwargs'], image_format], sort_keys=True))
+
+        image = self.cache.get(key)
+
+        if image is None:
+            image = self.pool.apply(render_worker_image, ((datafile, content_hash, job, image_format),))
+            self.cache.put(key, image)
+
+        return image, image_format
+
+    # Describes the endpoints and data files, and how well the cache is doing
+    def overview(self):
+        return {'endpoints': [endpoint for endpoint in ENDPOINTS if endpoint not in DATA_KINDS],
+                'data': sorted(self.datafiles.kinds),
+                'cache': self.cache.stats()}
+
+    def server_close(self):
+        super().server_close()
+
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+
+
+class ChartRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+
+        url = urllib.parse.urlsplit(self.path)
+        endpoint = url.path.strip('/')
+
+        if endpoint == '':
+            self.send_body(200, 'application/json', json.dumps(self.server.overview(), indent=2).encode())
+            return
+
+        if endpoint not in ENDPOINTS:
+            self.send_body(404, 'text/plain', ("Unknown endpoint '" + endpoint + "'").encode())
+            return
+
+        try:
+            image, image_format = self.server.chart(endpoint, url.query)
+
+        # Missing or bad inputs, and values which aren't in the data, are the client's mistake
+        except (KeyError, ValueError) as error:
+            self.send_body(400, 'text/plain', ("Bad request: " + str(error)).encode())
+            return
+
+        except Exception as error:
+            self.send_body(500, 'text/plain', ("Could not draw graph: " + repr(error)).encode())
+            return
+
+        self.send_body(200, CONTENT_TYPES[image_format], image)
+
+    def send_body(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def parse_arguments(argv):
+
+    parser = argparse.ArgumentParser(description="Serve infection data graphs over HTTP.")
+    parser.add_argument('--data', nargs='+', required=True, help="the csv files graphs can be drawn from")
+    parser.add_argument('--host', default='127.0.0.1', help="the address to listen on (default 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8000, help="the port to listen on (default 8000)")
+    parser.add_argument('--processes', type=int, help="how many worker processes draw graphs (default one per CPU)")
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE,
+                        help="the most rendered images kept in memory (default " + str(CACHE_SIZE) + ")")
+
+    return parser.parse_args(argv)
+
+
+def main():
+
+    arguments = parse_arguments(sys.argv[1:])
+
+    server = ChartServer((arguments.host, arguments.port), arguments.data, arguments.processes, arguments.cache_size)
+
+    print("Serving graphs on http://" + arguments.host + ":" + str(server.server_port) + "/")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+GENERAL INFORMATION
+
+Name: columnstore.py
+
+Description: Saves a dataframe as a directory of typed, per-column binary files, and loads it back as memory-mapped
+arrays. Loading doesn't parse anything, and the operating system shares the mapped pages between every process that
+opens the same directory, so one copy of the data can serve many worker processes.
+
+Layout of a column store directory:
+
+    columns.json    the column names in order, and how each column is stored
+    <n>.npy         the values of column n (numeric columns)
+    <n>.npy         the category codes of column n, with -1 for missing values (text columns)
+    <n>.json        the categories of column n (text columns)
+
+Testing: Example function calls are provided at the bottom to test code functionality.
+
+"""
+
+
+import json
+import os
+
+from lazyimport import lazy_import
+
+# Imported the first time data is read or written (see lazyimport.py)
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+
+# Name of the file describing the columns of a store
+COLUMNS_FILE = 'columns.json'
+
+
+# Writes every column of a dataframe into a column store directory
+def write_columns(dataframe, directory):
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    columns = []
+
+    for number, column in enumerate(dataframe.columns):
+        data = dataframe[column]
+        path = os.path.join(directory, str(number))
+
+        # Numbers and booleans are stored as they are
+        if pd.api.types.is_numeric_dtype(data) or pd.api.types.is_bool_dtype(data):
+            values = data.to_numpy()
+            np.save(path + '.npy', values)
+            columns.append({'name': column, 'kind': 'numeric', 'dtype': values.dtype.str})
+
+        # Everything else (e.g. text) is stored as integer codes into a list of categories
+        else:
+            if isinstance(data.dtype, pd.CategoricalDtype):
+                codes = data.cat.codes.to_numpy()
+                categories = data.cat.categories
+            else:
+                codes, categories = pd.factorize(data)
+
+            np.save(path + '.npy', codes.astype(np.int32))
+
+            with open(path + '.json', 'w') as json_file:
+                json.dump([str(category) for category in categories], json_file)
+
+            columns.append({'name': column, 'kind': 'category'})
+
+    # Write the description last, so a half-written store is never mistaken for a complete one
+    with open(os.path.join(directory, COLUMNS_FILE), 'w') as json_file:
+        json.dump(columns, json_file)
+
+
+# Checks whether a directory holds a complete column store
+def is_column_store(directory):
+    return os.path.isfile(os.path.join(directory, COLUMNS_FILE))
+
+
+# Loads a column store directory as a dataframe. Numeric columns and category codes are memory-mapped rather than
+# read into memory. Only the named columns are loaded if a list of columns is given
+def read_columns(directory, columns=None):
+
+    with open(os.path.join(directory, COLUMNS_FILE)) as json_file:
+        stored_columns = json.load(json_file)
+
+    data = {}
+
+    for number, column in enumerate(stored_columns):
+        if columns is not None and column['name'] not in columns:
+            continue
+
+        path = os.path.join(directory, str(number))
+        values = np.load(path + '.npy', mmap_mode='r')
+
+        if column['kind'] == 'category':
+            with open(path + '.json') as json_file:
+                categories = json.load(json_file)
+
+            values = pd.Categorical.from_codes(values, categories=categories)
+
+        data[column['name']] = values
+
+    return pd.DataFrame(data, copy=False)
+
+
+""" Test Code """
+
+# Test 1: Saves 'covid-data.csv' as a column store, loads it back and prints the column types
+# covid_df = pd.read_csv('datafiles/covid-data.csv')
+# write_columns(covid_df, 'covid-columns')
+# print(read_columns('covid-columns').dtypes)
@@ -1,8 +1,22 @@
 # Name: data_cleaning.py
 # Description: A module that contains all the one-off scripts created to clean and parse data
 
+import json
+import os
+
 import pandas as pd
-import csv
+
+# Columns kept in 'covid-data.csv', in order
+COVID_DATA_COLUMNS = ['iso_code', 'continent', 'location', 'date', 'total_cases', 'total_deaths',
+                      'total_cases_per_million', 'reproduction_rate', 'population', 'population_density',
+                      'gdp_per_capita', 'life_expectancy']
+
+# How missing values and line endings are written, to match the existing datafiles (written by the csv module)
+MISSING_VALUE = 'nan'
+LINE_TERMINATOR = '\r\n'
+
+# NB: Every output file is compressed if its name ends in a compressed extension (e.g. 'covid-data.csv.gz'), and pandas
+# reads compressed files the same way
 
 """
 
@@ -11,83 +25,140 @@ import csv
 """
 
 
-# Function slices the last data point of each country in the dataframe and stores the information in a list
-def prune_data():
+# Function streams the raw OWID data in chunks and keeps only the last data point of each country, storing the
+# information in a list. Only one row per country is held in memory at a time, so memory use stays flat no matter
+# how large the source file is
+def prune_data(source_file="sourcedata/owid-covid-data.csv", chunk_size=100000, columns=None):
+
+    # Only parse the requested columns, if any (the iso code is always needed)
+    usecols = None
+    if columns is not None:
+        usecols = ['iso_code'] + [column for column in columns if column != 'iso_code']
 
-    dataframe = pd.read_csv("sourcedata/owid-covid-data.csv")
+    # Keeps track of the most recent row seen for each country id, in the order the countries first appear
+    country_tails = {}
 
-    # Keeps track of when the country id switches
-    prev_country = dataframe.iloc[0, 0]
+    # Read the source file a chunk at a time instead of loading it all into memory
+    for chunk in pd.read_csv(source_file, usecols=usecols, chunksize=chunk_size):
 
-    country_list = []
+        # Keep only the last row of each country id within this chunk
+        chunk_tails = chunk.drop_duplicates(subset='iso_code', keep='last')
 
-    # Iterate over all the rows in the dataframe, and pull the last captured datapoint for each country
-    for i in range(len(dataframe)-1):
+        # Overwrite the running tail of each country with its newest row. A country spanning several chunks ends up
+        # with the row from the last chunk it appears in
+        for iso_code, row in zip(chunk_tails['iso_code'].values, chunk_tails.itertuples(index=False)):
+            country_tails[iso_code] = row
 
-        # Pulls the country id from the current index
-        current_country = dataframe.iloc[i, 0]
+    return list(country_tails.values())
 
-        # If the program has reached a new country id, store the information from the final
-        # instance of the previous country
-        if current_country != prev_country:
 
-            # Replace the old country id with the new one
-            prev_country = current_country
+# Function takes the list of data objects (or a dataframe) and writes a new csv file with the desired categories, in
+# one bulk write
+def create_csv(data_list, output_file='covid-data.csv'):
 
-            country_list.append(dataframe.iloc[i-1, :])
+    # Build a dataframe of only the desired columns
+    if isinstance(data_list, pd.DataFrame):
+        dataframe = data_list[COVID_DATA_COLUMNS]
+    else:
+        dataframe = pd.DataFrame(data_list)[COVID_DATA_COLUMNS]
 
-    return country_list
+    dataframe.to_csv(output_file, index=False, na_rep=MISSING_VALUE, lineterminator=LINE_TERMINATOR)
 
 
-# Function takes the list of data objects and writes a new csv file with the desired categories
-def create_csv(data_list):
-    with open('covid-data.csv', 'w', ) as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(['iso_code', 'continent', 'location', 'date', 'total_cases', 'total_deaths',
-                         'total_cases_per_million', 'reproduction_rate', 'population', 'population_density',
-                         'gdp_per_capita', 'life_expectancy'])
-        for data in data_list:
-            writer.writerow([data.iso_code, data.continent, data.location, data.date, data.total_cases,
-                             data.total_deaths, data.total_cases_per_million, data.reproduction_rate,
-                             data.population, data.population_density, data.gdp_per_capita, data.life_expectancy])
+# Function creates 'covid-data.csv' straight from the raw OWID data, only parsing the desired columns
+def create_covid_data(source_file="sourcedata/owid-covid-data.csv", output_file='covid-data.csv'):
+    create_csv(prune_data(source_file, columns=COVID_DATA_COLUMNS), output_file)
 
 
 """
 
- Script to create 'iso-codes.csv'
+ Scripts to refresh 'covid-data.csv' with daily OWID updates
 
 """
 
 
-# Create a csv file containing iso codes and their respective countries, using the info in 'covid-data.csv'
-def create_iso_codes_file():
+# Reads the date of the newest data point ingested for each country id. Starts from the dates in the snapshot file if
+# no watermarks have been saved yet
+def read_watermarks(watermark_file, snapshot):
+
+    if os.path.isfile(watermark_file):
+        with open(watermark_file) as json_file:
+            return json.load(json_file)
+
+    return dict(zip(snapshot['iso_code'].astype(str), snapshot['date'].astype(str)))
+
+
+# Reads an updated OWID source file, or a file of only the newest rows, and updates 'covid-data.csv' with any data
+# newer than what it already holds. Each country's newest ingested date (its watermark) is saved alongside the
+# snapshot, so only rows past the watermark are kept while streaming, and only the countries with new data are
+# replaced. Returns the iso codes of the countries that were updated
+def ingest_update(update_file, snapshot_file='covid-data.csv', watermark_file=None, chunk_size=100000):
+
+    if watermark_file is None:
+        watermark_file = snapshot_file + '.watermarks.json'
+
+    snapshot = pd.read_csv(snapshot_file)
+    watermarks = read_watermarks(watermark_file, snapshot)
+
+    # Keeps track of the newest row for each country with new data
+    country_tails = {}
+
+    for chunk in pd.read_csv(update_file, usecols=COVID_DATA_COLUMNS, chunksize=chunk_size):
+
+        # Keep only the rows dated after their country's watermark (dates are ISO formatted, so they compare as text).
+        # Countries without a watermark are new, so all their rows are kept
+        chunk_watermarks = chunk['iso_code'].map(watermarks)
+        new_rows = chunk[chunk_watermarks.isna() | (chunk['date'].astype(str) > chunk_watermarks.fillna(''))]
+
+        # Keep the newest new row of each country in this chunk, then the newest across all the chunks
+        new_rows = new_rows.sort_values('date', kind='stable').drop_duplicates(subset='iso_code', keep='last')
+
+        for iso_code, row in zip(new_rows['iso_code'].values, new_rows.itertuples(index=False)):
+            if iso_code not in country_tails or str(row.date) >= str(country_tails[iso_code].date):
+                country_tails[iso_code] = row
 
-    # Create a dataframe using the data in the file
-    dataframe = pd.read_csv('covid_data.csv')
+    if not country_tails:
+        return []
 
-    # A list of all the countries
-    countries_list = []
+    # Replace the rows of the updated countries, keeping the file's order, and add any new countries at the end
+    updates = pd.DataFrame(list(country_tails.values()))[COVID_DATA_COLUMNS].set_index('iso_code')
+    snapshot = snapshot.set_index('iso_code')
 
-    # A list of all the iso codes
-    iso_list = []
+    existing = updates.index.isin(snapshot.index)
+    snapshot.loc[updates.index[existing]] = updates[existing]
+    snapshot = pd.concat([snapshot, updates[~existing]])
 
-    # Iterate over all the items in the "location" column and store all new values in the countries list
-    for country in dataframe['location'].values:
-        if country not in countries_list:
-            countries_list.append(country)
+    create_csv(snapshot.reset_index(), snapshot_file)
 
-    # Iterate over all the items in the "iso_code" column and store all new values in the iso_list
-    for code in dataframe['iso_code'].values:
-        if code not in iso_list:
-            iso_list.append(code)
+    # Save the new watermarks last, so an interrupted ingest is simply repeated
+    for iso_code, row in country_tails.items():
+        watermarks[str(iso_code)] = str(row.date)
 
-    # Open and write a csv file containing iso codes in the first column, and locations (i.e. countries) in the second
-    with open('iso-codes.csv', 'w') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(['location', 'iso_code'])
+    with open(watermark_file, 'w') as json_file:
+        json.dump(watermarks, json_file, indent=0)
 
-        for code in range(len(iso_list)):
-            writer.writerow([countries_list[code], iso_list[code]])
+    return list(country_tails.keys())
+
+
+"""
+
+ Script to create 'iso-codes.csv'
+
+"""
+
+
+# Create a csv file containing iso codes and their respective countries, using the info in 'covid-data.csv'
+def create_iso_codes_file(source_file='covid-data.csv', output_file='iso-codes.csv'):
+
+    # Create a dataframe of only the locations and iso codes in the file
+    dataframe = pd.read_csv(source_file, usecols=['location', 'iso_code'])
+
+    # Keep the first row of each distinct (location, iso code) pair, in one hashed pass, so each location stays
+    # paired with its own iso code
+    pairs = dataframe[['location', 'iso_code']].drop_duplicates()
+
+    # Write a csv file containing locations (i.e. countries) in the first column, and iso codes in the second
+    pairs.to_csv(output_file, index=False, na_rep=MISSING_VALUE, lineterminator=LINE_TERMINATOR)
 
 
 """
@@ -99,29 +170,13 @@ def create_iso_codes_file():
 
 # Calculate deaths per million using total death and population data in a csv file, and create a new csv file
 # with the additional deaths per million column
-def add_dpm():
+def add_dpm(source_file='datafiles/panepi-data.csv', output_file='panepi-data.csv'):
 
     # Create a dataframe
-    df = pd.read_csv('datafiles/panepi-data.csv')
+    df = pd.read_csv(source_file)
 
     # Calculate deaths per million, and create a new deaths per million column
     df['deaths_per_million'] = df['est_total_deaths'] / (df['population']/1000000)
 
-    # Create a new csv file using the updated dataframe
-    with open('panepi-data.csv', 'w') as csvfile:
-
-        # Create a writer object
-        writer = csv.writer(csvfile)
-
-        # Write the first row of data (column headers) into the csv file
-        writer.writerow(list(df.columns))
-
-        # Iterate over the length of the dataframe (number of rows), writing each row of data into the csv file one
-        # at a time
-        for i in range(len(df)):
-            # Slice the dataframe by index and store that row's data
-            row = df.iloc[i]
-
-            # Write the row data
-            writer.writerow([row.infection, row.continent, row.duration_in_years, row.est_total_deaths, row.population, row.deaths_per_million])
-
+    # Create a new csv file using the updated dataframe, in one bulk write
+    df.to_csv(output_file, index=False, na_rep=MISSING_VALUE, lineterminator=LINE_TERMINATOR)
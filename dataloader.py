@@ -0,0 +1,391 @@
+"""
+GENERAL INFORMATION
+
+Name: dataloader.py
+
+Description: Loads the csv datafiles (e.g. 'covid-data.csv', 'panepi-data.csv', 'iso-codes.csv' or a full OWID source
+file) through a transparent on-disk cache. The first time a file is loaded it is parsed with pandas and saved as a
+typed column store (see columnstore.py). Later loads memory-map the column store instead of parsing the csv again.
+
+The cache is keyed by a hash of the file's contents, so an edited file is always parsed again. The file's size and
+modification time are recorded alongside the hash, so an unchanged file doesn't need to be re-hashed either.
+
+The cache lives in '.datacache' in the working directory, unless the INFEC_CACHE_DIR environment variable says
+otherwise.
+
+A file can also be loaded in a background thread (prefetch_csv), so loading overlaps with whatever the program does
+next, e.g. waiting for the user to answer a prompt.
+
+A loaded dataframe is wrapped in a Dataset, which keeps indexes of the columns the visualizers query (iso codes,
+infections and continents), so each graph only has to copy the rows it needs rather than the whole file.
+
+Testing: Example function calls are provided at the bottom to test code functionality.
+
+"""
+
+
+import concurrent.futures
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import columnstore
+import profiler as prof
+import schemas
+from lazyimport import lazy_import
+
+# Imported the first time data is read (see lazyimport.py)
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+
+# Directory the cached column stores are kept in
+CACHE_DIR = os.environ.get('INFEC_CACHE_DIR', '.datacache')
+
+# Name of the file recording the hash, size and modification time of every cached csv file
+FILES_INDEX = 'files.json'
+
+
+""" Content Hashing """
+
+
+# Hashes the contents of a file, reading it a block at a time
+def hash_file(datafile):
+
+    content_hash = hashlib.sha256()
+
+    with open(datafile, 'rb') as source:
+        for block in iter(lambda: source.read(1 << 20), b''):
+            content_hash.update(block)
+
+    return content_hash.hexdigest()
+
+
+# Reads the record of every csv file the cache has seen
+def read_files_index(cache_dir):
+
+    index_path = os.path.join(cache_dir, FILES_INDEX)
+
+    if not os.path.isfile(index_path):
+        return {}
+
+    with open(index_path) as json_file:
+        return json.load(json_file)
+
+
+# Saves the record of every csv file the cache has seen
+def write_files_index(cache_dir, files_index):
+
+    # Write to a temporary file first so the index is never left half-written. Each write gets its own file, so
+    # threads and processes saving the index at the same time don't write over each other's temporary files
+    index_path = os.path.join(cache_dir, FILES_INDEX)
+    handle, temp_path = tempfile.mkstemp(prefix=FILES_INDEX + '.', dir=cache_dir)
+
+    try:
+        with os.fdopen(handle, 'w') as json_file:
+            json.dump(files_index, json_file)
+
+        os.replace(temp_path, index_path)
+
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+# Returns the content hash of a csv file. The hash is only recalculated if the file's size or modification time has
+# changed since it was last hashed
+def file_version(datafile, cache_dir=CACHE_DIR):
+
+    path = os.path.abspath(datafile)
+    stat = os.stat(path)
+
+    files_index = read_files_index(cache_dir)
+    record = files_index.get(path)
+
+    if record is not None and record['size'] == stat.st_size and record['mtime'] == stat.st_mtime_ns:
+        return record['hash']
+
+    content_hash = hash_file(path)
+
+    files_index[path] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': content_hash}
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    write_files_index(cache_dir, files_index)
+
+    return content_hash
+
+
+""" Loading """
+
+
+# Loads a csv file as a dataframe, through the cache. Files of a known family (see schemas.py) are checked for the
+# columns the visualizers need, and loaded with the family's column types. Other numeric columns keep their parsed
+# types and text columns are loaded as categories
+def load_csv(datafile, cache_dir=CACHE_DIR):
+    with prof.span('load'):
+        return load_cached(datafile, cache_dir)
+
+
+# Returns the directory holding the cached column store of the current version of a csv file. A cached copy is only
+# used if it was made with the current schemas
+def store_path(datafile, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, file_version(datafile, cache_dir) + '-' + schemas.SCHEMA_VERSION)
+
+
+# Loads a csv file through the cache (see load_csv)
+def load_cached(datafile, cache_dir):
+
+    headers = read_headers(datafile)
+    family = schemas.detect_family(headers)
+    schemas.validate_columns(family, headers, datafile)
+
+    store_directory = store_path(datafile, cache_dir)
+
+    # Parse the csv file and save it as a column store, if this version of the file hasn't been cached yet
+    build_store(lambda: pd.read_csv(datafile, dtype=schemas.column_dtypes(family, headers)), store_directory,
+                cache_dir)
+
+    return columnstore.read_columns(store_directory)
+
+
+# Saves the dataframe returned by make_dataframe as a column store in store_directory, unless one is already there
+# (make_dataframe is only called if it isn't). The store is built in a temporary directory and moved into place once
+# it's complete, so a half-built store is never read
+def build_store(make_dataframe, store_directory, cache_dir=CACHE_DIR):
+
+    if columnstore.is_column_store(store_directory):
+        return
+
+    dataframe = make_dataframe()
+    temp_directory = tempfile.mkdtemp(prefix='building-', dir=cache_dir)
+
+    try:
+        columnstore.write_columns(dataframe, temp_directory)
+        os.replace(temp_directory, store_directory)
+
+    except OSError:
+        # Another process built the same store at the same time
+        if not columnstore.is_column_store(store_directory):
+            raise
+
+    finally:
+        shutil.rmtree(temp_directory, ignore_errors=True)
+
+
+# Loads only some columns of a csv file, and only the rows matching a filter, without parsing the rest of the file.
+# The filter maps key columns to the values to keep, e.g. {'iso_code': ['USA', 'CAN']} keeps the rows of two
+# countries. If the file is already cached, the columns are memory-mapped from the cache. Otherwise the file is read a
+# chunk at a time, parsing only the requested columns and keeping only the matching rows of each chunk. Lines whose
+# first column (e.g. the iso code) doesn't match are skipped without being parsed at all
+def load_query(datafile, columns=None, where=None, cache_dir=CACHE_DIR, chunk_size=100000):
+    with prof.span('load'):
+        return query_csv(datafile, columns, where or {}, cache_dir, chunk_size)
+
+
+# Loads part of a csv file (see load_query)
+def query_csv(datafile, columns, where, cache_dir, chunk_size):
+
+    headers = read_headers(datafile)
+    family = schemas.detect_family(headers)
+
+    # The filter's columns are needed too. Columns are kept in the file's order
+    wanted = set(headers if columns is None else columns) | set(where)
+    unknown = sorted(wanted.difference(headers))
+    if unknown:
+        raise ValueError(str(datafile) + " has no columns named: " + ", ".join(unknown))
+
+    usecols = [column for column in headers if column in wanted]
+
+    store_directory = store_path(datafile, cache_dir)
+
+    if columnstore.is_column_store(store_directory):
+        dataframe = columnstore.read_columns(store_directory, usecols)
+        return dataframe[matching_rows(dataframe, where)].reset_index(drop=True)
+
+    # Chunks are read without categories, which would differ from chunk to chunk, and converted once at the end
+    dtypes = schemas.column_dtypes(family, usecols, categories=False)
+
+    # Filtering on the first column can be done on the raw lines, before any of the other lines are parsed
+    source = datafile
+    if headers[0] in where:
+        source = key_lines(datafile, where[headers[0]])
+
+    chunks = []
+    for chunk in pd.read_csv(source, usecols=usecols, dtype=dtypes, chunksize=chunk_size):
+        chunks.append(chunk[matching_rows(chunk, where)])
+
+    dataframe = pd.concat(chunks, ignore_index=True)
+
+    for column, dtype in schemas.column_dtypes(family, usecols).items():
+        if dtype == 'category':
+            dataframe[column] = dataframe[column].astype('category')
+
+    return dataframe
+
+
+# Returns the header line of a csv file and the lines whose first value is one of the given values, as a file-like
+# object for pandas. Lines are compared as bytes, without being parsed
+def key_lines(datafile, values):
+
+    # A value may be written with or without quotes
+    prefixes = tuple(prefix.encode() for value in values for prefix in (str(value) + ',', '"' + str(value) + '",'))
+
+    opener = gzip.open if datafile.endswith('.gz') else open
+
+    with opener(datafile, 'rb') as csvfile:
+        lines = [csvfile.readline()]
+        lines.extend(line for line in csvfile if line.startswith(prefixes))
+
+    return io.BytesIO(b''.join(lines))
+
+
+# Returns a boolean mask of the rows of a dataframe whose key columns hold one of the filter's values
+def matching_rows(dataframe, where):
+
+    mask = np.ones(len(dataframe), dtype=bool)
+
+    for column, values in where.items():
+        mask &= dataframe[column].isin(list(values)).to_numpy()
+
+    return mask
+
+
+# Deletes every cached column store
+def clear_cache(cache_dir=CACHE_DIR):
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+""" Indexed Datasets """
+
+
+class Dataset:
+
+    # Wraps a loaded dataframe. Indexes of the rows holding each value of a column (e.g. every row for 'USA' in the
+    # 'iso_code' column) are built once, and then kept for every later query
+    def __init__(self, dataframe):
+
+        self.dataframe = dataframe
+        self.indexes = {}
+
+        # Build the indexes the visualizers query, for the type of data in the file
+        headers = dataframe.columns.values
+
+        if headers[0] == 'iso_code':
+            self.index('iso_code')
+        elif headers[0] == 'infection':
+            self.index('infection')
+            self.index('continent')
+            self.index(('infection', 'continent'))
+
+    # Returns the index of a column (or a tuple of columns), as a dictionary of each value (or tuple of values) and the
+    # positions of the rows that hold it
+    def index(self, columns):
+
+        if columns not in self.indexes:
+            keys = list(columns) if isinstance(columns, tuple) else columns
+            self.indexes[columns] = self.dataframe.groupby(keys, sort=False, observed=True, dropna=False).indices
+
+        return self.indexes[columns]
+
+    # Returns the rows holding any of the given values of a column (or tuples of values of a tuple of columns), in the
+    # order the values are given. Only the selected rows are copied. Raises a KeyError for a value that isn't in the
+    # data, like DataFrame.loc
+    def select(self, columns, values):
+
+        index = self.index(columns)
+
+        missing = [value for value in values if value not in index]
+        if missing:
+            raise KeyError(str(missing) + " not in " + str(columns))
+
+        positions = np.concatenate([index[value] for value in values]) if values else np.array([], dtype=np.intp)
+
+        return self.dataframe.take(positions)
+
+
+# Returns a dataframe's Dataset, or the Dataset itself if one is passed in. Waits for a dataset that is still loading
+def dataset_of(data):
+
+    if isinstance(data, Dataset):
+        return data
+
+    if isinstance(data, PendingDataset):
+        return data.result()
+
+    return Dataset(data)
+
+
+""" Background Loading """
+
+
+# Runs loading work in the background, created the first time it's needed
+_background = None
+
+
+# Starts running a function in a background thread, and returns a future holding its result
+def prefetch(function, *args):
+    global _background
+
+    if _background is None:
+        _background = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix='prefetch')
+
+    return _background.submit(function, *args)
+
+
+# Loads and indexes a csv file
+def load_dataset(datafile):
+    return Dataset(load_csv(datafile))
+
+
+class PendingDataset:
+
+    # Wraps a dataset that is loading in the background. It can be passed around like a Dataset, and only waits for
+    # the loading to finish when its data is actually used
+    def __init__(self, future):
+        self.future = future
+
+    # Waits for the dataset to finish loading, and returns it. Raises any error the loading ran into
+    def result(self):
+        return self.future.result()
+
+    @property
+    def dataframe(self):
+        return self.result().dataframe
+
+    def index(self, columns):
+        return self.result().index(columns)
+
+    def select(self, columns, values):
+        return self.result().select(columns, values)
+
+
+# Starts loading and indexing a csv file in the background, and returns a PendingDataset for it
+def prefetch_csv(datafile):
+    return PendingDataset(prefetch(load_dataset, datafile))
+
+
+# Reads only the column names of a csv file (compressed with gzip if its name ends in '.gz')
+def read_headers(datafile):
+
+    opener = gzip.open if datafile.endswith('.gz') else open
+
+    with opener(datafile, 'rt', newline='') as csvfile:
+        return next(csv.reader(csvfile), [])
+
+
+""" Test Code """
+
+# Test 1: Loads 'covid-data.csv' twice. The first load parses the csv file, the second memory-maps the cached copy
+# covid_df = load_csv('datafiles/covid-data.csv')
+# covid_df = load_csv('datafiles/covid-data.csv')
+# print(covid_df.dtypes)
+
+# Test 2: Prints the rows for the United States and Canada, using the iso code index
+# covid_data = Dataset(covid_df)
+# print(covid_data.select('iso_code', ['USA', 'CAN']))
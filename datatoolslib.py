@@ -11,63 +11,428 @@ Testing: Example function calls are provided at the bottom to test code function
 """
 
 
-import pandas as pd
+import bisect
+import csv
+import os
+import weakref
 
 
 """ For Single-Infection Visualizers """
 
 
-# Reads iso-codes.csv and creates a dictionary of all iso codes and their associated countries
-def create_iso_dict():
+# Location of the file containing every iso code and its associated country
+ISO_FILE = 'datafiles/iso-codes.csv'
 
-    # Create a dataframe from a file with iso codes and their countries
-    iso_info = pd.read_csv('datafiles/iso-codes.csv')
 
-    # Create a dictionary using the locations as keys
-    iso_dict = iso_info.set_index('location')['iso_code'].to_dict()
+# An in-memory index of iso-codes.csv. The file is read once and only read again if it changes on disk (i.e. its
+# modification time moves), so repeated lookups don't re-parse the file
+class IsoIndex:
 
-    # Return the dictionary
-    return iso_dict
+    def __init__(self, iso_file=ISO_FILE):
+        self.iso_file = iso_file
+        self.mtime = None
+
+        # Country name -> iso code, and iso code -> country name
+        self.by_country = {}
+        self.by_code = {}
+
+        # Lowercase country names, sorted, paired with their original spelling (for prefix searches)
+        self.sorted_names = []
+        self.sorted_keys = []
+
+        # Typo-tolerant indexes of the country names, and of the iso codes (which also accept country names)
+        self.country_index = ValueIndex([])
+        self.code_index = ValueIndex([])
+
+    # Reloads the file if it has never been read or has changed since it was last read
+    def refresh(self):
+        mtime = os.path.getmtime(self.iso_file)
+
+        if mtime != self.mtime:
+            self.load()
+            self.mtime = mtime
+
+        return self
+
+    # Reads the file and rebuilds all the lookup tables
+    def load(self):
+        by_country = {}
+        by_code = {}
+
+        with open(self.iso_file, newline='') as csvfile:
+            for row in csv.DictReader(csvfile):
+                by_country[row['location']] = row['iso_code']
+                by_code[row['iso_code']] = row['location']
+
+        self.by_country = by_country
+        self.by_code = by_code
+        self.sorted_names = sorted(by_country, key=str.lower)
+        self.sorted_keys = [name.lower() for name in self.sorted_names]
+        self.country_index = ValueIndex(by_country)
+        self.code_index = ValueIndex(by_code, aliases=by_country)
+
+    # Returns the iso code of a country, or None if the country isn't in the file
+    def iso_code(self, country):
+        return self.refresh().by_country.get(country)
+
+    # Returns the country of an iso code, or None if the code isn't in the file
+    def country(self, iso_code):
+        return self.refresh().by_code.get(iso_code)
+
+    # Checks whether a string is one of the iso codes in the file
+    def is_iso_code(self, iso_code):
+        return iso_code in self.refresh().by_code
+
+    # Returns a list of (country, iso code) pairs whose country name starts with the given prefix, ignoring case
+    def search(self, prefix):
+        self.refresh()
+
+        prefix = prefix.lower()
+
+        # The names are sorted, so all matches sit in one block starting at the first name >= the prefix
+        start = bisect.bisect_left(self.sorted_keys, prefix)
+
+        matches = []
+        for i in range(start, len(self.sorted_keys)):
+            if not self.sorted_keys[i].startswith(prefix):
+                break
+
+            name = self.sorted_names[i]
+            matches.append((name, self.by_country[name]))
+
+        return matches
+
+    # Returns the closest country names to a misspelt one
+    def suggest(self, country, limit=10):
+        return self.refresh().country_index.suggest(country, limit)
+
+
+# One shared index per iso file for the whole process
+_iso_indexes = {}
+
+
+# Returns the process-wide iso index for a file, creating it the first time it is requested
+def get_iso_index(iso_file=ISO_FILE):
+
+    if iso_file not in _iso_indexes:
+        _iso_indexes[iso_file] = IsoIndex(iso_file)
+
+    return _iso_indexes[iso_file].refresh()
+
+
+# Creates a dictionary of all iso codes and their associated countries, using the cached iso index
+def create_iso_dict(iso_file=ISO_FILE):
+
+    # Return a copy so callers can't change the shared index
+    return dict(get_iso_index(iso_file).by_country)
 
 
 # Takes a string of a country name, and outputs its iso code
 def find_iso_code(country_string):
 
-    # Create the dictionary and store it in a variable
-    country_dictionary = create_iso_dict()
+    # Get the shared iso index
+    iso_index = get_iso_index()
 
-    if country_string not in country_dictionary.keys():
+    iso_code = iso_index.iso_code(country_string)
+
+    if iso_code is None:
         print("\nOops! That's not a country in the iso lookup.")
+
+        # Suggest countries that start with what the user typed, or else countries spelt almost the same way
+        suggestions = iso_index.search(country_string)
+        if not suggestions:
+            suggestions = [(name, iso_index.iso_code(name)) for name in iso_index.suggest(country_string)]
+
+        if suggestions:
+            print("Did you mean: " + ", ".join(name + " (" + code + ")" for name, code in suggestions[:10]))
         return
 
-    # Run a search in the dictionary using the string as a key, and print the result to the console
-    print("\n" + country_dictionary[country_string])
+    # Print the result to the console
+    print("\n" + iso_code)
+
+
+""" Typo-Tolerant Lookups """
+
+
+# Returns the number of single character insertions, deletions and substitutions that turn one string into another
+def edit_distance(first, second):
+
+    # A shared beginning or ending doesn't change the distance, so only the differing middle is compared
+    start = 0
+    while start < len(first) and start < len(second) and first[start] == second[start]:
+        start += 1
+
+    end = 0
+    while end < len(first) - start and end < len(second) - start and first[-1 - end] == second[-1 - end]:
+        end += 1
+
+    first = first[start:len(first) - end]
+    second = second[start:len(second) - end]
+
+    if len(first) < len(second):
+        first, second = second, first
+
+    # Only the previous row of the distance table is needed to work out the next one
+    previous = list(range(len(second) + 1))
+
+    for i, first_char in enumerate(first, 1):
+        current = [i]
+
+        for j, second_char in enumerate(second, 1):
+            current.append(min(previous[j] + 1,
+                               current[j - 1] + 1,
+                               previous[j - 1] + (first_char != second_char)))
+
+        previous = current
+
+    return previous[-1]
+
+
+# A BK-tree of strings, which finds every string within a given edit distance of a query without comparing the query
+# against all of them. Each node keeps its children by their distance from it, and the triangle inequality rules out
+# every child further than the search distance from the query's own distance to the node
+class BKTree:
+
+    def __init__(self, words=()):
+        self.root = None
+
+        for word in words:
+            self.add(word)
+
+    def add(self, word):
+
+        # A node is a [word, {distance: child node}] pair
+        if self.root is None:
+            self.root = [word, {}]
+            return
+
+        node = self.root
+
+        while True:
+            distance = edit_distance(word, node[0])
+
+            if distance == 0:
+                return
+
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [word, {}]
+                return
+
+            node = child
+
+    # Returns (distance, word) pairs for every word within max_distance of a query, closest first
+    def search(self, word, max_distance):
+
+        matches = []
+        nodes = [self.root] if self.root is not None else []
+
+        while nodes:
+            node = nodes.pop()
+            distance = edit_distance(word, node[0])
+
+            if distance <= max_distance:
+                matches.append((distance, node[0]))
+
+            for child_distance, child in node[1].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    nodes.append(child)
+
+        return sorted(matches)
+
+
+# An index of the valid values of something the user types in (e.g. the continents in a file). Exact matches are a
+# single dictionary lookup, matches ignoring case are accepted too, and a misspelt value gets the closest valid values
+# as suggestions. Aliases are other names for a value (e.g. country names for iso codes), which are also accepted
+class ValueIndex:
+
+    def __init__(self, values, aliases=None):
+
+        # Every accepted spelling -> the value it stands for
+        self.exact = {}
+        for value in values:
+            self.exact[str(value)] = value
+        for alias, value in (aliases or {}).items():
+            self.exact.setdefault(str(alias), value)
+
+        # The same, ignoring case
+        self.folded = {}
+        for spelling, value in self.exact.items():
+            self.folded.setdefault(spelling.lower(), value)
+
+        # A BK-tree of the lowercase spellings, built the first time a suggestion is needed
+        self.tree = None
+
+    def __contains__(self, value):
+        return value in self.exact
+
+    def __len__(self):
+        return len(self.exact)
+
+    # Returns the valid value a string stands for, ignoring case, or None if it doesn't match any value
+    def match(self, value):
+
+        if value in self.exact:
+            return self.exact[value]
+
+        return self.folded.get(str(value).lower())
+
+    # Returns up to limit valid values spelt closest to a string, closest first. Longer strings may be further off
+    def suggest(self, value, limit=5):
+
+        if self.tree is None:
+            self.tree = BKTree(self.folded)
+
+        value = str(value).lower()
+        max_distance = max(2, len(value) // 3)
+
+        suggestions = []
+        for distance, spelling in self.tree.search(value, max_distance):
+            suggestion = self.folded[spelling]
+
+            if suggestion not in suggestions:
+                suggestions.append(suggestion)
+
+            if len(suggestions) == limit:
+                break
+
+        return suggestions
 
 
 """ For All Modules """
 
 
+# Quantiles included in the profile of a numeric column
+PROFILE_QUANTILES = (0.25, 0.5, 0.75)
+
+# Column profiles and value indexes of each loaded dataframe, by the dataframe's id. A dataframe's profiles and indexes
+# are dropped when the dataframe is deleted
+_column_profiles = {}
+_value_indexes = {}
+
+
+# Returns the cached results for a dataframe from one of the caches above
+def dataframe_cache(cache, dataframe):
+
+    key = id(dataframe)
+
+    if key not in cache:
+        cache[key] = {}
+
+        # Forget the results once the dataframe is gone, so a new dataframe with the same id can't pick them up
+        weakref.finalize(dataframe, cache.pop, key, None)
+
+    return cache[key]
+
+
+# Summarizes one column: its type, how many values are missing, how many distinct values it has, and either its
+# distinct values (text columns) or its minimum, maximum and quantiles (numeric columns)
+def profile_column(data):
+
+    non_null = data.dropna()
+
+    profile = {'dtype': str(data.dtype), 'rows': len(data), 'nulls': len(data) - len(non_null)}
+
+    # Numeric columns (booleans, integers and floats)
+    if getattr(data.dtype, 'kind', 'O') in 'biuf':
+        profile['numeric'] = True
+        profile['distinct'] = int(non_null.nunique())
+
+        if len(non_null):
+            profile['min'] = float(non_null.min())
+            profile['max'] = float(non_null.max())
+            profile['quantiles'] = {q: float(value) for q, value in non_null.quantile(list(PROFILE_QUANTILES)).items()}
+
+    # Text (and other) columns, with their distinct values in the order they first appear
+    else:
+        profile['numeric'] = False
+        profile['values'] = list(non_null.unique())
+        profile['distinct'] = len(profile['values'])
+
+    return profile
+
+
+# Returns the profile of a column of a dataframe, working it out only the first time it's requested
+def column_profile(dataframe, column):
+
+    profiles = dataframe_cache(_column_profiles, dataframe)
+
+    if column not in profiles:
+        profiles[column] = profile_column(dataframe[column])
+
+    return profiles[column]
+
+
+# Returns a typo-tolerant index (see ValueIndex) of the distinct values of a column, built only the first time it's
+# requested
+def value_index(dataframe, column):
+
+    indexes = dataframe_cache(_value_indexes, dataframe)
+
+    if column not in indexes:
+        indexes[column] = ValueIndex(column_profile(dataframe, column)['values'])
+
+    return indexes[column]
+
+
+# Returns a typo-tolerant index of the column names of a dataframe, built only the first time it's requested
+def column_index(dataframe):
+
+    indexes = dataframe_cache(_value_indexes, dataframe)
+
+    # Column names are strings, so a tuple key can't clash with one
+    if ('columns',) not in indexes:
+        indexes[('columns',)] = ValueIndex(dataframe.columns)
+
+    return indexes[('columns',)]
+
+
+# Describes a column's profile in one line
+def describe_profile(column, profile):
+
+    description = (str(column) + " (" + profile['dtype'] + "): " + str(profile['distinct']) + " distinct, " +
+                   str(profile['nulls']) + " missing")
+
+    if profile['numeric'] and 'min' in profile:
+        quantiles = ", ".join(format(q, '.0%') + " " + format(value, '.6g')
+                              for q, value in profile['quantiles'].items())
+        description += (", min " + format(profile['min'], '.6g') + ", max " + format(profile['max'], '.6g') +
+                        ", quantiles " + quantiles)
+
+    return description
+
+
+# Summarizes a whole dataframe as a list of lines: its size, then one line per column
+def summarize_data(dataframe):
+
+    lines = [str(len(dataframe)) + " rows, " + str(len(dataframe.columns)) + " columns"]
+
+    for column in dataframe.columns:
+        lines.append(describe_profile(column, column_profile(dataframe, column)))
+
+    return lines
+
+
 # Displays a summary of the information provided by a given datafile. Takes a solo file input,
 # a file input + the string 'headers', or a file input + the name of a column as a string
 def available_info(dataframe, data_type=None):
 
-    # If the user has only input a filename, print the entire dataframe and return the function
+    # If the user has only input a filename, return a summary of each column (rather than the entire dataframe)
     if data_type is None:
-        return dataframe
+        return summarize_data(dataframe)
 
     # If the user has requested only the column names from the dataframe, print the column values as a list and return
     if data_type == 'headers':
         return dataframe.columns.values
 
-    # If the user has input a filename and a column name as a string, print the column's values as a list
-    data = dataframe[data_type]
-    data_values = data.values
+    # If the user has input a filename and a column name as a string, return the column's distinct values if it holds
+    # text, or its values if it holds numbers. The distinct values are only worked out once per dataframe
+    profile = column_profile(dataframe, data_type)
 
-    if type(data_values[0]) is str:
-        no_dup = data.drop_duplicates()
-        return no_dup.values
+    if not profile['numeric']:
+        return profile['values']
 
-    return data_values
+    return dataframe[data_type].values
 
 
 """ Test Code """
@@ -79,6 +444,13 @@ def available_info(dataframe, data_type=None):
 # find_iso_code('Algeria')
 
 # Test 2: Prints all the available continents from 'covid-data.csv' as a list
+# import pandas as pd
 # covid_df = pd.read_csv(COVID_19)
 # continent_info = available_info(covid_df, 'continent')
 # print(continent_info)
+
+# Test 3: Prints a one-line summary of every column in 'covid-data.csv'
+# print("\n".join(available_info(covid_df)))
+
+# Test 4: Prints ['North America'], the closest continent to a misspelling
+# print(value_index(covid_df, 'continent').suggest('Nort America'))
@@ -0,0 +1,44 @@
+"""
+GENERAL INFORMATION
+
+Name: lazyimport.py
+
+Description: Defers importing a module until one of its attributes is first used. pandas, numpy and matplotlib take
+over a second to import, so the modules in this project import them through lazy_import. That way an iso code lookup
+or a '--help' doesn't pay for matplotlib, and matplotlib is only imported once a graph is actually drawn.
+
+Usage:
+
+    plt = lazy_import('matplotlib.pyplot')   # nothing is imported yet
+    plt.figure()                             # matplotlib.pyplot is imported here, once
+
+Testing: See benchmarks.py, which checks which heavy modules each project module imports and how long it takes.
+
+"""
+
+
+import importlib
+
+
+class LazyModule:
+
+    # Stores the name of the module to import later
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    # Imports the module the first time any of its attributes is requested, then hands out its attributes
+    def __getattr__(self, attribute):
+
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+
+        return getattr(self._module, attribute)
+
+    def __repr__(self):
+        return "<lazy module '" + self._name + "'>"
+
+
+# Returns a stand-in for a module which imports it on first use
+def lazy_import(name):
+    return LazyModule(name)
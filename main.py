@@ -1,33 +1,66 @@
 # Name: main.py
 # Description: A script to access and run all the infection data visualizers
+#
+# Run with no arguments for the interactive console. Run with arguments to render graphs to files without any
+# prompts, e.g.
+#
+#   python main.py --data datafiles/covid-data.csv --visualizer v1 --stat total_deaths --countries USA CAN
+#   python main.py --spec nightly-report.json
+#
+# See parse_arguments and build_job for every option, and run 'python main.py --help'. Add '--profile' to either mode
+# to save timing traces of each visualization (see profiler.py), and '--render-cache' to the command line to copy graphs
+# drawn before from unchanged data instead of drawing them again (see rendercache.py)
+
+import argparse
+import collections
+import json
+import os
+import sys
+import time
 
 import visualizers as vs
 import datatoolslib as dtl
-import pandas as pd
+import dataloader as dl
+import batchrender as br
+import profiler as prof
+import rendercache as rc
+import rollup
+import schemas
 
 
 # Sub functions
 
-# Stores dataframe of desired csv file and displays the available visualizations for the type of data
+# Starts loading an indexed dataset of desired csv file in the background, and displays the available visualizations
+# for the type of data. The data keeps loading while the user answers the next prompts
 def data_selector():
 
     available_visualizations = None
 
     datafile = input("\nPlease input the name or path of the csv file you wish to pull data from: ")
-    dataframe = pd.read_csv(datafile)
 
-    headers = dataframe.columns.values
+    # Only the column names are needed to choose the visualizations
+    headers = dl.read_headers(datafile)
+    family = schemas.detect_family(headers)
+    schemas.validate_columns(family, headers, datafile)
+
+    dataset = dl.prefetch_csv(datafile)
 
     # If data is about one infection, or multiple infections
-    if headers[0] == 'iso_code':
+    if family == 'covid':
+
+        # The country visualizers look up iso codes, so load the iso index in the background too
+        dl.prefetch(dtl.get_iso_index)
+
+        # Country data can also be rolled up to continents (see rollup.py)
         available_visualizations = {'v1': "Compare up to three user-selected countries [v1]",
-                                    'v2': "Compare between all countries [v2]"}
-    elif headers[0] == 'infection':
+                                    'v2': "Compare between all countries [v2]",
+                                    'v4': "Compare " + rollup.INFECTION + " in two continents [v4]"}
+    elif family == 'panepi':
         available_visualizations = {'v3': "Compare two infections in one location [v3]",
                                     'v4': "Compare one infection in two locations [v4]",
                                     'v5': "Compare two infections in two locations [v5]"}
 
-    return dataframe, available_visualizations
+    return dataset, available_visualizations
 
 
 # Loop that lets the user lookup multiple iso codes
@@ -44,8 +77,54 @@ def run_iso_assist():
         dtl.find_iso_code(country)
 
 
-# Requests a statistic from the user and provides options for viewing the dataframe
-def get_stat(dataframe):
+# The most lines printed at once before asking the user whether to see more
+PAGE_SIZE = 20
+
+
+# Prints a list of lines a page at a time, asking the user before printing each further page
+def print_pages(lines, page_size=PAGE_SIZE):
+
+    for start in range(0, len(lines), page_size):
+        if start > 0:
+            more = input("\n-- " + str(start) + " of " + str(len(lines)) + " shown. Press enter to see more, or type "
+                         "'stop': ")
+            if more == 'stop':
+                return
+
+        for line in lines[start:start + page_size]:
+            print(line)
+
+
+# Prints a summary of a column, followed by its distinct values a page at a time if it holds text
+def print_column_info(dataframe, column):
+
+    if column not in dataframe.columns:
+        print("\nOops! This data is not available in your file.")
+        return
+
+    profile = dtl.column_profile(dataframe, column)
+
+    print("")
+    print(dtl.describe_profile(column, profile))
+
+    if not profile['numeric']:
+        print("")
+        print_pages([str(value) for value in dtl.available_info(dataframe, column)])
+
+
+# Returns the dataframe statistics are chosen from: the dataset's own, or for the continent visualizers its continent
+# data (country data is rolled up to continents, see rollup.py)
+def stat_dataframe(dataset, continents=False):
+
+    if continents:
+        return rollup.continent_dataset(dataset).dataframe
+
+    return dataset.dataframe
+
+
+# Requests a statistic from the user and provides options for viewing the dataframe. The dataframe is only waited for
+# once the user has answered. The continent visualizers choose from the columns of the continent data
+def get_stat(dataset, continents=False):
     stat = None
 
     while stat is None:
@@ -56,16 +135,16 @@ def get_stat(dataframe):
                      "\nType 'value check' to see all available data for a particular statistic"
                      "\n\nEnter choice: ")
 
-        # Print a summary of the entire dataframe
+        # Print a summary of each column in the dataframe
         if stat == 'data':
-            data = dtl.available_info(dataframe)
+            data = dtl.available_info(stat_dataframe(dataset, continents))
             print("")
-            print(data)
+            print_pages(data)
             stat = None
 
         # Print a list of the columns as stat options
         if stat == 'options':
-            data = dtl.available_info(dataframe, 'headers')
+            data = dtl.available_info(stat_dataframe(dataset, continents), 'headers')
             print("")
             print(data)
             stat = None
@@ -73,22 +152,19 @@ def get_stat(dataframe):
         # View values in a specified column
         if stat == 'value check':
             check = input("\nPlease enter the name of the statistic you'd like see values for: ")
-            data = dtl.available_info(dataframe, check)
-            print("")
-            print(data)
+            print_column_info(stat_dataframe(dataset, continents), check)
             stat = None
 
         # Check whether stat is a viable value
         if stat is not None and stat != 'options' and stat != 'data':
-            if stat not in list(dataframe.columns):
-                print("\nOops! This data is not available in your file.\n")
-                stat = None
-            else:
+            stat = check_value(stat, dtl.column_index(stat_dataframe(dataset, continents)),
+                               "\nOops! This data is not available in your file.")
+            if stat is not None:
                 return stat
 
 
 # Provides two different ways to lookup dataframe info, for different types of datasets
-def value_search(dataframe, value_name, query_type, lookup_func):
+def value_search(dataset, value_name, query_type, lookup_func):
 
     value = None
 
@@ -111,31 +187,54 @@ def value_search(dataframe, value_name, query_type, lookup_func):
             quit()
 
         if value == 'view':
-            available_categories = dtl.available_info(dataframe, 'headers')
+            available_categories = dtl.available_info(dataset.dataframe, 'headers')
 
             print("")
             print(available_categories)
 
             more_info = input("\nPlease enter one of the above categories to view its contents: ")
 
-            data = dtl.available_info(dataframe, more_info)
-
-            print("")
-            print(data)
+            print_column_info(dataset.dataframe, more_info)
 
             value = None
 
     return value
 
 
+# Checks a value the user typed against an index of valid values (see datatoolslib.ValueIndex), and returns the valid
+# value it stands for. A misspelt value gets the closest valid values as suggestions, and the user can take the
+# closest one. Returns None if the value isn't accepted
+def check_value(value, value_index, oops_message):
+
+    match = value_index.match(value)
+    if match is not None:
+        return match
+
+    print(oops_message)
+
+    suggestions = value_index.suggest(value)
+    if not suggestions:
+        return None
+
+    if len(suggestions) > 1:
+        print("Close matches: " + ", ".join(str(suggestion) for suggestion in suggestions))
+
+    use_suggestion = input("Did you mean '" + str(suggestions[0]) + "'? [y/n]: ")
+
+    if use_suggestion == 'y':
+        return suggestions[0]
+
+    return None
+
+
 # Runs processes to help user input and/or find a desired value
-def get_value(dataframe, value_name, query_type=None, lookup_func=None, value_checker=None):
+def get_value(dataset, value_name, query_type=None, lookup_func=None, value_checker=None):
 
     value = None
 
     while value is None:
         if query_type is not None:  # the dataframe and/or value can be queried, user is notified of this option
-            value = value_search(dataframe, value_name, query_type, lookup_func)
+            value = value_search(dataset, value_name, query_type, lookup_func)
         else:
             value = input("\nPlease input a " + value_name + ": ")
 
@@ -147,55 +246,65 @@ def get_value(dataframe, value_name, query_type=None, lookup_func=None, value_ch
 
             value_options = value_checker()
 
-            if type(value_options) == dict:
-                if value not in list(value_options.values()):
-                    print("\nOops! That's not a valid " + value_name + ".")
-                    value = None
+            # Iso codes are checked against the iso index, which also accepts country names
+            if isinstance(value_options, dtl.IsoIndex):
+                value_options = value_options.code_index
+
+            elif type(value_options) == dict:
+                value_options = dtl.ValueIndex(value_options.values())
 
             elif type(value_options) == list:
-                if value not in value_options:
-                    print("\nOops! That's not a valid " + value_name + ".")
-                    value = None
+                value_options = dtl.ValueIndex(value_options)
+
+            value = check_value(value, value_options, "\nOops! That's not a valid " + value_name + ".")
 
     return value
 
 
+# Returns a value checker for get_value, which checks values against the distinct values of a column of the continent
+# data (country data is rolled up to continents). The dataset is only waited for once a value has been typed in
+def column_checker(dataset, column):
+    return lambda: dtl.value_index(rollup.continent_dataset(dataset).dataframe, column)
+
+
 # Visualizers
 
 # Guides user through inputting values for comp_infec_between_countries, and runs the function
-def run_vone(dataframe):
+def run_vone(dataset):
 
     iso_code2 = None
     iso_code3 = None
 
-    iso_code1 = get_value(dataframe, 'iso code', query_type='keyword search', lookup_func=run_iso_assist,
-                          value_checker=dtl.create_iso_dict)
+    iso_code1 = get_value(dataset, 'iso code', query_type='keyword search', lookup_func=run_iso_assist,
+                          value_checker=dtl.get_iso_index)
 
     add_country = input("\nWould you like to add another country? [y/n]: ")
 
     if add_country == 'y':
-        iso_code2 = get_value(dataframe, 'iso code', query_type='keyword search', lookup_func=run_iso_assist,
-                              value_checker=dtl.create_iso_dict)
+        iso_code2 = get_value(dataset, 'iso code', query_type='keyword search', lookup_func=run_iso_assist,
+                              value_checker=dtl.get_iso_index)
 
         add_country = input("\nWould you like to add a final country? [y/n]: ")
 
         if add_country == 'y':
-            iso_code3 = get_value(dataframe, 'iso code', query_type='keyword search', lookup_func=run_iso_assist,
-                                  value_checker=dtl.create_iso_dict)
+            iso_code3 = get_value(dataset, 'iso code', query_type='keyword search', lookup_func=run_iso_assist,
+                                  value_checker=dtl.get_iso_index)
 
-    stat = get_stat(dataframe)
+    stat = get_stat(dataset)
 
-    vs.comp_infec_between_countries(dataframe, stat, iso_code1, iso_code2, iso_code3)
+    # Time the visualization only, not the prompts before it
+    with prof.trace('v1'):
+        vs.comp_infec_between_countries(dataset, stat, iso_code1, iso_code2, iso_code3)
 
 
 # Guides user through inputting values for infec_stat_all_countries, and runs the function
-def run_vtwo(dataframe):
+def run_vtwo(dataset):
 
     # Value presets, in case user chooses not to use one
     top = False
     bottom = False
     sample_size = None
-    stat = get_stat(dataframe)
+    stat = get_stat(dataset)
 
     order = input("\nWould you like to sort the data by highest stats, lowest stats, or pull data alphabetically? "
                   "[high/low/alpha]: ")
@@ -214,68 +323,82 @@ def run_vtwo(dataframe):
         sample_query = input("\nPlease enter a valid option [sample/all]: ")
 
     if sample_query == 'sample':
-        sample_size = int(get_value(dataframe, 'sample size'))
+        sample_size = int(get_value(dataset, 'sample size'))
 
-    vs.infec_stat_all_countries(dataframe, sample_size, stat, top, bottom)
+    with prof.trace('v2'):
+        vs.infec_stat_all_countries(dataset, sample_size, stat, top, bottom)
 
 
 # Guides user through inputting values for comp_infec_in_continent, and runs the function
-def run_vthree(dataframe):
+def run_vthree(dataset):
 
-    continent = get_value(dataframe, 'continent', query_type='option display')
-    infection1 = get_value(dataframe, 'first infection', query_type='option display')
-    infection2 = get_value(dataframe, 'second infection', query_type='option display')
-    stat = get_stat(dataframe)
+    continent = get_value(dataset, 'continent', query_type='option display',
+                          value_checker=column_checker(dataset, 'continent'))
+    infection1 = get_value(dataset, 'first infection', query_type='option display',
+                           value_checker=column_checker(dataset, 'infection'))
+    infection2 = get_value(dataset, 'second infection', query_type='option display',
+                           value_checker=column_checker(dataset, 'infection'))
+    stat = get_stat(dataset, continents=True)
 
-    vs.comp_infec_in_continent(dataframe, continent, infection1, infection2, stat)
+    with prof.trace('v3'):
+        vs.comp_infec_in_continent(dataset, continent, infection1, infection2, stat)
 
 
 # Guides user through inputting values for comp_infec_between_continents, and runs the function
-def run_vfour(dataframe):
+def run_vfour(dataset):
 
-    infection = get_value(dataframe, 'infection', query_type='option display')
-    continent1 = get_value(dataframe, 'first continent', query_type='option display')
-    continent2 = get_value(dataframe, 'second continent', query_type='option display')
+    infection = get_value(dataset, 'infection', query_type='option display',
+                          value_checker=column_checker(dataset, 'infection'))
+    continent1 = get_value(dataset, 'first continent', query_type='option display',
+                           value_checker=column_checker(dataset, 'continent'))
+    continent2 = get_value(dataset, 'second continent', query_type='option display',
+                           value_checker=column_checker(dataset, 'continent'))
 
-    stat = get_stat(dataframe)
+    stat = get_stat(dataset, continents=True)
 
-    vs.comp_infec_between_continents(dataframe, infection, continent1, continent2, stat)
+    with prof.trace('v4'):
+        vs.comp_infec_between_continents(dataset, infection, continent1, continent2, stat)
 
 
 # Guides user through inputting values for multi_comp, and runs the function
-def run_vfive(dataframe):
+def run_vfive(dataset):
 
-    infection1 = get_value(dataframe, 'first infection', query_type='option display')
-    infection2 = get_value(dataframe, 'second infection', query_type='option display')
+    infection1 = get_value(dataset, 'first infection', query_type='option display',
+                           value_checker=column_checker(dataset, 'infection'))
+    infection2 = get_value(dataset, 'second infection', query_type='option display',
+                           value_checker=column_checker(dataset, 'infection'))
 
-    continent1 = get_value(dataframe, 'first continent', query_type='option display')
-    continent2 = get_value(dataframe, 'second continent', query_type='option display')
+    continent1 = get_value(dataset, 'first continent', query_type='option display',
+                           value_checker=column_checker(dataset, 'continent'))
+    continent2 = get_value(dataset, 'second continent', query_type='option display',
+                           value_checker=column_checker(dataset, 'continent'))
 
-    stat = get_stat(dataframe)
+    stat = get_stat(dataset, continents=True)
 
-    vs.multi_comp(dataframe, infection1, infection2, continent1, continent2, stat)
+    with prof.trace('v5'):
+        vs.multi_comp(dataset, infection1, infection2, continent1, continent2, stat)
 
 
 # Reads user input and decides which function to run
-def run_visualizer(chosen_visualization, dataframe):
+def run_visualizer(chosen_visualization, dataset):
     if chosen_visualization == 'v1':
-        run_vone(dataframe)
+        run_vone(dataset)
 
     if chosen_visualization == 'v2':
-        run_vtwo(dataframe)
+        run_vtwo(dataset)
 
     if chosen_visualization == 'v3':
-        run_vthree(dataframe)
+        run_vthree(dataset)
 
     if chosen_visualization == 'v4':
-        run_vfour(dataframe)
+        run_vfour(dataset)
 
     if chosen_visualization == 'v5':
-        run_vfive(dataframe)
+        run_vfive(dataset)
 
 
-# Displays available visualizations for a given dataframe and asks for user's choice
-def display_visualization_options(available_visualizations, dataframe):
+# Displays available visualizations for a given dataset and asks for user's choice
+def display_visualization_options(available_visualizations, dataset):
     print("\nPlease select which type of visualization you'd like to run.\n")
 
     for i in available_visualizations.values():
@@ -286,28 +409,28 @@ def display_visualization_options(available_visualizations, dataframe):
     while chosen_visualization not in available_visualizations.keys():
         chosen_visualization = input("\nSorry, please choose a valid option: ")
 
-    run_visualizer(chosen_visualization, dataframe)
+    run_visualizer(chosen_visualization, dataset)
 
 
 # Run entire program
 def run_program():
     available_visualizations = None
-    dataframe = None
+    dataset = None
     same_data = False
 
     # Allow user to stay in program to run multiple visualizations
     running = True
     while running:
 
-        if same_data is False:  # Keep track of whether user wants to do multiple visualizations with same dataframe
+        if same_data is False:  # Keep track of whether user wants to do multiple visualizations with same dataset
 
             # Ask for the type of data in their file of choice
             visualizer_data = data_selector()
 
-            dataframe = visualizer_data[0]
+            dataset = visualizer_data[0]
             available_visualizations = visualizer_data[1]
 
-        display_visualization_options(available_visualizations, dataframe)
+        display_visualization_options(available_visualizations, dataset)
 
         visualize_more = input("\nWould you like to run another visualization? [y/n]: ")
 
@@ -327,8 +450,261 @@ def run_program():
                 same_data = False
 
 
+# Command line
+
+# Exit codes for the command line: every job rendered, at least one job failed, or the command itself was invalid
+EXIT_OK = 0
+EXIT_JOB_FAILED = 1
+EXIT_USAGE = 2
+
+
+# Reads the command line options
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Render infection data visualizations to image files without any "
+                                                 "prompts.")
+
+    parser.add_argument('--spec', help="a JSON (or YAML) file listing many jobs to run")
+    parser.add_argument('--data', help="the csv file to pull data from")
+    parser.add_argument('--visualizer', choices=['v1', 'v2', 'v3', 'v4', 'v5'], help="the visualization to run")
+    parser.add_argument('--stat', help="the statistic to compare")
+    parser.add_argument('--countries', nargs='+', help="up to three iso codes [v1]")
+    parser.add_argument('--order', choices=['high', 'low', 'alpha'], default='alpha', help="how to sort [v2]")
+    parser.add_argument('--sample-size', type=int, help="how many countries to show, or all if left out [v2]")
+    parser.add_argument('--infection', help="the infection to compare [v4]")
+    parser.add_argument('--infections', nargs=2, help="the two infections to compare [v3, v5]")
+    parser.add_argument('--continent', help="the continent to compare in [v3]")
+    parser.add_argument('--continents', nargs=2, help="the two continents to compare [v4, v5]")
+    parser.add_argument('--output', help="the image file to write (the extension picks png or svg)")
+    parser.add_argument('--output-dir', default='.', help="where to write images without an output path")
+    parser.add_argument('--format', choices=list(br.IMAGE_FORMATS), default='png', help="the default image format")
+    parser.add_argument('--render-cache', nargs='?', const=rc.CACHE_DIR, metavar='DIR',
+                        help="copy graphs drawn from unchanged data before out of a cache in DIR, instead of drawing "
+                             "them again (default " + rc.CACHE_DIR + ")")
+    parser.add_argument('--render-cache-mb', type=float, help="the most megabytes of graphs the render cache keeps")
+    parser.add_argument('--profile', action='store_true', help="save a timing trace of each visualization run "
+                                                               "(also works with the interactive console)")
+    parser.add_argument('--profile-file', help="where to save the timing traces (default " + prof.TRACE_FILE + ")")
+    parser.add_argument('--profile-memory', action='store_true', help="also record peak memory use in the traces")
+
+    return parser.parse_args(argv)
+
+
+# Reads a spec file. It holds a list of jobs, or a dictionary with a list of 'jobs' and optional defaults for
+# 'data', 'output_dir' and 'format'. Raises a ValueError if the file can't be parsed or holds anything else
+def read_spec(spec_file):
+
+    with open(spec_file) as spec:
+        if spec_file.endswith(('.yaml', '.yml')):
+            import yaml  # Only needed for YAML spec files
+            try:
+                spec_data = yaml.safe_load(spec)
+            except yaml.YAMLError as error:
+                raise ValueError("Invalid YAML: " + str(error))
+        else:
+            spec_data = json.load(spec)
+
+    if isinstance(spec_data, list):
+        spec_data = {'jobs': spec_data}
+
+    jobs = spec_data.get('jobs', []) if isinstance(spec_data, dict) else None
+
+    if not isinstance(jobs, list) or not all(isinstance(job, dict) for job in jobs):
+        raise ValueError("A spec file must hold a list of jobs, or a dictionary with a list of 'jobs', where each job "
+                         "is a dictionary")
+
+    return spec_data
+
+
+# The named parameters each visualizer needs in a job
+REQUIRED_PARAMETERS = {'v1': ('stat', 'countries'),
+                       'v2': ('stat',),
+                       'v3': ('stat', 'continent', 'infections'),
+                       'v4': ('stat', 'infection', 'continents'),
+                       'v5': ('stat', 'infections', 'continents'),
+                       'dashboard': ('panels',)}
+
+
+# Builds a batch job (see batchrender.py) from named parameters, which mirror the interactive prompts. A job that
+# already has its visualizer 'args' is used as it is. A 'dashboard' job lists its graphs as 'panels', each built the
+# same way, with an optional number of 'columns' and a 'title'. Raises a ValueError for an unknown visualizer or a
+# missing parameter
+def build_job(params):
+
+    if 'args' in params:
+        return params
+
+    visualizer = params.get('visualizer')
+
+    if visualizer not in REQUIRED_PARAMETERS:
+        raise ValueError("Unknown visualizer '" + str(visualizer) + "'")
+
+    missing = [name for name in REQUIRED_PARAMETERS[visualizer] if params.get(name) is None]
+    if missing:
+        raise ValueError(visualizer + " needs the parameters: " + ", ".join(missing))
+
+    stat = params.get('stat')
+    args = None
+    kwargs = {}
+
+    # A dashboard's panels are jobs of their own, drawn together on one image
+    if visualizer == 'dashboard':
+        panels = [build_job(panel) for panel in params['panels']]
+        args = [[{key: panel[key] for key in ('visualizer', 'args', 'kwargs') if key in panel} for panel in panels]]
+        kwargs = {key: params[key] for key in ('columns', 'title') if params.get(key) is not None}
+
+    elif visualizer == 'v1':
+        countries = params['countries']
+        if not 1 <= len(countries) <= 3:
+            raise ValueError("v1 compares one to three countries")
+        args = [stat] + list(countries)
+
+    elif visualizer == 'v2':
+        order = params.get('order', 'alpha')
+        kwargs = {'top': order == 'high', 'bottom': order == 'low'}
+        args = [params.get('sample_size'), stat]
+
+    elif visualizer == 'v3':
+        args = [params['continent']] + list(params['infections']) + [stat]
+
+    elif visualizer == 'v4':
+        args = [params['infection']] + list(params['continents']) + [stat]
+
+    elif visualizer == 'v5':
+        args = list(params['infections']) + list(params['continents']) + [stat]
+
+    job = {'visualizer': visualizer, 'args': args, 'kwargs': kwargs}
+
+    for key in ('data', 'output'):
+        if params.get(key) is not None:
+            job[key] = params[key]
+
+    return job
+
+
+# Renders every job one after the other in this process, loading each csv file only once. A file only one job uses
+# is loaded with just the columns and rows that job needs (see dataloader.load_query). Prints one line per job
+# with its timing, and returns the command line exit code. With a render cache (see rendercache.py), graphs drawn
+# from unchanged data before are copied from the cache, and a file is only loaded if some graph has to be drawn
+def run_jobs(jobs, data=None, output_dir='.', image_format='png', render_cache=None):
+
+    br.start_headless()
+
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    datasets = {}
+    rollups = {}
+    exit_code = EXIT_OK
+
+    # How many jobs use each file
+    file_uses = collections.Counter(params.get('data', data) for params in jobs)
+
+    for job_number, params in enumerate(jobs):
+        start = time.perf_counter()
+
+        try:
+            job = build_job(params)
+
+            # Load each file the first time a job asks for it
+            datafile = job.get('data', data)
+            if datafile is None:
+                raise ValueError("No data file given")
+
+            result = None
+            data_version = None
+
+            if render_cache is not None:
+                data_version = dl.file_version(datafile)
+                result = br.fetch_cached_job(render_cache, data_version, job, job_number, output_dir, image_format)
+
+            if result is None:
+                headers = dl.read_headers(datafile)
+
+                # Continent jobs on country data are drawn from the file's rolled up continents, which are cached on
+                # disk for each version of the file
+                rolled_up = br.continent_job(job) and schemas.detect_family(headers) == 'covid'
+
+                query = None
+                if file_uses[datafile] == 1 and not rolled_up:
+                    query = br.job_query(job, headers)
+
+                if rolled_up:
+                    if datafile not in rollups:
+                        rollups[datafile] = dl.Dataset(rollup.load_rollup(datafile))
+                    dataset = rollups[datafile]
+                elif query is not None:
+                    dataset = dl.Dataset(dl.load_query(datafile, *query))
+                elif datafile in datasets:
+                    dataset = datasets[datafile]
+                else:
+                    dataset = datasets[datafile] = dl.Dataset(dl.load_csv(datafile))
+
+                result = br.render_job(dataset, job, job_number, output_dir, image_format, render_cache, data_version)
+
+        except Exception as error:
+            seconds = time.perf_counter() - start
+            print("job " + str(job_number) + " FAILED in " + format(seconds, '.3f') + "s: " + repr(error))
+            exit_code = EXIT_JOB_FAILED
+            continue
+
+        seconds = time.perf_counter() - start
+        print("job " + str(job_number) + " ok in " + format(seconds, '.3f') + "s (" +
+              ("cached" if result['cached'] else "render") + " " + format(result['seconds'], '.3f') + "s): " +
+              result['output'])
+
+    if render_cache is not None:
+        stats = render_cache.stats()
+        print("render cache: " + str(stats['hits']) + " hits, " + str(stats['misses']) + " misses, " +
+              str(stats['evictions']) + " evicted, " + format(stats['bytes'] / 1024 / 1024, '.1f') + " of " +
+              format(stats['max_bytes'] / 1024 / 1024, '.1f') + " MB used")
+
+    return exit_code
+
+
+# Runs the command line options, returning the exit code
+def run_command_line(arguments):
+
+    render_cache = None
+    if arguments.render_cache is not None:
+        max_bytes = rc.MAX_BYTES if arguments.render_cache_mb is None else int(arguments.render_cache_mb * 1024 * 1024)
+        render_cache = rc.RenderCache(arguments.render_cache, max_bytes)
+
+    if arguments.spec is not None:
+        try:
+            spec = read_spec(arguments.spec)
+        except (OSError, ValueError, ImportError) as error:
+            print("Could not read the spec file: " + repr(error), file=sys.stderr)
+            return EXIT_USAGE
+
+        return run_jobs(spec.get('jobs', []), spec.get('data', arguments.data),
+                        spec.get('output_dir', arguments.output_dir), spec.get('format', arguments.format),
+                        render_cache)
+
+    if arguments.visualizer is None or arguments.data is None or arguments.stat is None:
+        print("Please give --spec, or --data, --visualizer and --stat", file=sys.stderr)
+        return EXIT_USAGE
+
+    # Check the options make a whole job before anything is loaded
+    try:
+        build_job(vars(arguments))
+    except ValueError as error:
+        print("Invalid options: " + str(error), file=sys.stderr)
+        return EXIT_USAGE
+
+    return run_jobs([vars(arguments)], arguments.data, arguments.output_dir, arguments.format, render_cache)
+
+
 def main():
 
+    arguments = parse_arguments(sys.argv[1:])
+
+    if arguments.profile or arguments.profile_memory:
+        prof.enable(arguments.profile_file, arguments.profile_memory)
+
+    # Run without prompts if any data or job options were given
+    if any(value is not None for value in (arguments.spec, arguments.data, arguments.visualizer, arguments.stat)):
+        sys.exit(run_command_line(arguments))
+
     print("\nHi, welcome to Infection Data Visualizer! \n")
 
     run_program()
@@ -0,0 +1,167 @@
+"""
+GENERAL INFORMATION
+
+Name: profiler.py
+
+Description: Optional timing instrumentation for visualization runs. The program marks its stages with named spans:
+
+    load      reading a data file (see dataloader.py)
+    slice     selecting the rows and values a graph needs
+    plot      building the graph with pandas and matplotlib
+    render    drawing the graph (on screen, or to a file)
+
+Each visualization run is a trace holding the spans recorded while it ran. When the run finishes, its trace is added
+to a JSON Lines file (one JSON object per line), so the traces of thousands of runs can be collected and compared.
+Spans recorded outside a run (e.g. loading a file before choosing a visualization) are saved as a trace of their own.
+Time spent waiting rather than working (e.g. while a graph is left on screen) is left out of a trace's seconds.
+
+Profiling is off unless it is switched on with the '--profile' option of main.py, or the INFEC_PROFILE environment
+variable. While it's off, spans cost next to nothing.
+
+Environment variables:
+
+    INFEC_PROFILE=1                 switch profiling on
+    INFEC_PROFILE_FILE=<path>       where to save traces (default 'profile-traces.jsonl')
+    INFEC_PROFILE_MEMORY=1          also record the peak Python memory use of each span (slower)
+
+"""
+
+
+import contextlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource  # Not available on Windows
+except ImportError:
+    resource = None
+
+
+# Whether spans are recorded, where traces are saved, and whether memory use is recorded
+ENABLED = os.environ.get('INFEC_PROFILE', '') not in ('', '0')
+TRACE_FILE = os.environ.get('INFEC_PROFILE_FILE', 'profile-traces.jsonl')
+MEMORY = os.environ.get('INFEC_PROFILE_MEMORY', '') not in ('', '0')
+
+# The trace currently being recorded, kept separately for each thread
+_current = threading.local()
+
+# Stops two threads writing to the trace file at the same time
+_write_lock = threading.Lock()
+
+
+# Switches profiling on, optionally changing where traces are saved and whether memory use is recorded
+def enable(trace_file=None, memory=None):
+    global ENABLED, TRACE_FILE, MEMORY
+
+    ENABLED = True
+
+    if trace_file is not None:
+        TRACE_FILE = trace_file
+    if memory is not None:
+        MEMORY = memory
+
+    if MEMORY and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+# Switches profiling off
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+# Adds a finished trace to the trace file
+def save_trace(record):
+    with _write_lock:
+        with open(TRACE_FILE, 'a') as trace_file:
+            trace_file.write(json.dumps(record, default=str) + "\n")
+
+
+# Records a visualization run as a trace. Any details given (e.g. the visualizer and its arguments) are saved with it
+@contextlib.contextmanager
+def trace(name, **details):
+
+    if not ENABLED or getattr(_current, 'record', None) is not None:
+        yield
+        return
+
+    record = {'trace': name, 'details': details, 'started': time.time(), 'spans': []}
+    _current.record = record
+    start = time.perf_counter()
+
+    try:
+        yield
+
+    except BaseException as error:
+        record['error'] = repr(error)
+        raise
+
+    finally:
+        _current.record = None
+        record['seconds'] = time.perf_counter() - start - record.get('idle_seconds', 0)
+
+        # The most memory the process has used so far (kilobytes on Linux, bytes on macOS)
+        if resource is not None:
+            record['max_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        save_trace(record)
+
+
+# Records how long a stage takes, and optionally its peak memory use, as part of the current trace
+@contextlib.contextmanager
+def span(name):
+
+    if not ENABLED:
+        yield
+        return
+
+    if MEMORY and tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+
+    start = time.perf_counter()
+
+    try:
+        yield
+
+    finally:
+        result = {'span': name, 'seconds': time.perf_counter() - start}
+
+        if MEMORY and tracemalloc.is_tracing():
+            result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+
+        record = getattr(_current, 'record', None)
+
+        # Save a span recorded outside any trace as a trace of its own
+        if record is None:
+            save_trace({'trace': name, 'details': {}, 'started': time.time(), 'spans': [result],
+                        'seconds': result['seconds']})
+        else:
+            record['spans'].append(result)
+
+
+# Leaves the time spent in a block (e.g. while a graph is left on screen) out of the current trace's seconds. The time
+# left out is saved with the trace as its idle seconds
+@contextlib.contextmanager
+def idle():
+
+    record = getattr(_current, 'record', None)
+
+    if not ENABLED or record is None:
+        yield
+        return
+
+    start = time.perf_counter()
+
+    try:
+        yield
+
+    finally:
+        record['idle_seconds'] = record.get('idle_seconds', 0) + time.perf_counter() - start
+
+
+# Start recording memory straight away if profiling was switched on by the environment
+if ENABLED and MEMORY:
+    tracemalloc.start()
@@ -0,0 +1,168 @@
+"""
+GENERAL INFORMATION
+
+Name: rendercache.py
+
+Description: Keeps rendered graphs on disk so a graph that was drawn before is copied rather than drawn again. Each
+graph is stored under a key made from the content hash of the csv file it was drawn from (see dataloader.py), the
+visualizer, its arguments and the image format, so a graph is only reused while its data is unchanged.
+
+The cache has a size limit. Once it grows past the limit, the least recently used graphs are deleted until it fits
+again. Using a graph marks it as recently used by updating its modification time, so the cache keeps working across
+runs and across processes without any shared index file.
+
+The cache lives in '.rendercache' in the working directory, unless the INFEC_RENDER_CACHE_DIR environment variable
+says otherwise. Its size limit is 256 megabytes, unless INFEC_RENDER_CACHE_MB says otherwise.
+
+Testing: Example function calls are provided at the bottom to test code functionality.
+
+"""
+
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+
+# Where rendered graphs are cached, and the most space they may take up
+CACHE_DIR = os.environ.get('INFEC_RENDER_CACHE_DIR', '.rendercache')
+MAX_BYTES = int(float(os.environ.get('INFEC_RENDER_CACHE_MB', '256')) * 1024 * 1024)
+
+
+# Returns the cache key of a graph: a hash of the data's content hash, the visualizer, its arguments and image format
+def render_key(data_version, visualizer, args, kwargs, image_format):
+
+    description = json.dumps([data_version, visualizer, args, kwargs, image_format], sort_keys=True, default=str)
+
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+class RenderCache:
+
+    # Opens (or creates) a render cache directory holding at most max_bytes of graphs
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.total_bytes = sum(size for path, size, used in self.entries())
+
+        # The size limit may be lower than the last time the cache was used
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    # Returns the path, size and last use time of every cached graph
+    def entries(self):
+
+        entries = []
+
+        with os.scandir(self.directory) as files:
+            for entry in files:
+                if entry.is_file() and not entry.name.startswith('.'):
+                    stat = entry.stat()
+                    entries.append((entry.path, stat.st_size, stat.st_mtime_ns))
+
+        return entries
+
+    def path(self, key, image_format):
+        return os.path.join(self.directory, key + '.' + image_format)
+
+    # Copies a cached graph to the output path. Returns whether the graph was cached
+    def fetch(self, key, image_format, output):
+
+        path = self.path(key, image_format)
+
+        try:
+            shutil.copyfile(path, output)
+            os.utime(path)
+
+        except FileNotFoundError:
+            # Not cached, or deleted by another process while being copied
+            self.misses += 1
+            return False
+
+        self.hits += 1
+        return True
+
+    # Adds a newly rendered graph file to the cache, then makes room if the cache has grown past its limit
+    def store(self, key, image_format, source):
+
+        path = self.path(key, image_format)
+
+        # A graph stored under the same key before is replaced, so its size no longer counts
+        try:
+            replaced_bytes = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced_bytes = 0
+
+        # Copy into a temporary file and move it into place, so a half-written graph is never fetched
+        handle, temp_path = tempfile.mkstemp(prefix='.storing-', dir=self.directory)
+        os.close(handle)
+
+        try:
+            shutil.copyfile(source, temp_path)
+            os.replace(temp_path, path)
+
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        self.total_bytes += os.path.getsize(path) - replaced_bytes
+
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    # Deletes the least recently used graphs until the cache fits within its size limit
+    def evict(self):
+
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        self.total_bytes = sum(size for path, size, used in entries)
+
+        for path, size, used in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+            self.total_bytes -= size
+            self.evictions += 1
+
+    # Deletes every cached graph
+    def clear(self):
+
+        for path, size, used in self.entries():
+            os.remove(path)
+
+        self.total_bytes = 0
+
+    # Returns how often the cache has been used, and how full it is
+    def stats(self):
+
+        lookups = self.hits + self.misses
+
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions, 'bytes': self.total_bytes, 'max_bytes': self.max_bytes}
+
+
+""" Test Code """
+
+# Test 1: Renders the same graph twice into a 'charts' directory. The second time it is copied from the cache
+# import main
+# main.run_jobs([{'visualizer': 'v1', 'stat': 'total_deaths', 'countries': ['USA', 'CAN']}] * 2,
+#               'datafiles/covid-data.csv', 'charts', render_cache=RenderCache())
+
+# Test 2: Shrinks the cache to 1 megabyte, deleting the least recently used graphs, and prints how full it is
+# cache = RenderCache(max_bytes=1024 * 1024)
+# cache.evict()
+# print(cache.stats())
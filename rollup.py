@@ -0,0 +1,131 @@
+"""
+GENERAL INFORMATION
+
+Name: rollup.py
+
+Description: Rolls country data (e.g. 'covid-data.csv' or a full OWID source file) up to one row per continent, plus
+one for the whole world, in the same shape as 'panepi-data.csv'. The continent visualizers use it to work straight
+from country data, so a new OWID snapshot never has to be aggregated by hand.
+
+How each column is combined:
+
+    counts (e.g. total_cases, population)       summed over the countries
+    rates (e.g. total_cases_per_million)        averaged over the countries, weighted by each country's population,
+                                                using only the countries that have the rate
+
+The rate columns are the float32 columns of the covid schema (see schemas.py). Only the most recent row of each country
+is used, as in data_cleaning.prune_data, and rows which are already totals (the 'World' row, and the OWID continent
+rows with no continent of their own) are left out.
+
+Rolled up data is cached: in memory for each loaded dataframe, and on disk (next to the data cache in dataloader.py)
+for each version of a csv file.
+
+Testing: Example function calls are provided at the bottom to test code functionality.
+
+"""
+
+
+import columnstore
+import dataloader as dl
+import datatoolslib as dtl
+import schemas
+from lazyimport import lazy_import
+
+# Imported the first time data is rolled up (see lazyimport.py)
+pd = lazy_import('pandas')
+
+
+# The infection rolled up country data is about
+INFECTION = 'COVID19'
+
+# The row holding the totals of every continent
+WORLD = 'World'
+
+# Column weighting the rates, when the data has it
+WEIGHT_COLUMN = 'population'
+
+# Rolled up datasets of each loaded dataframe, by the dataframe's id (see datatoolslib.dataframe_cache)
+_rollups = {}
+
+
+# Rolls a dataframe of country data up to one row per continent and one for the world. Returns a dataframe with
+# 'infection' and 'continent' columns followed by the rolled up numeric columns
+def rollup_countries(dataframe, infection=INFECTION):
+
+    # The most recent row of each country, leaving out rows that are already totals
+    data = dataframe.drop_duplicates(subset='iso_code', keep='last')
+    data = data[data['continent'].notna() & (data['continent'] != WORLD)]
+
+    numeric_columns = [column for column in data.columns if pd.api.types.is_numeric_dtype(data[column])]
+    rate_columns = [column for column in numeric_columns if schemas.is_rate_column('covid', column)]
+
+    if WEIGHT_COLUMN in data.columns:
+        weights = data[WEIGHT_COLUMN].astype('float64')
+    else:
+        weights = pd.Series(1.0, index=data.index)
+
+    # Counts are summed as they are. Each rate is summed multiplied by its weight, alongside the total weight of the
+    # countries that have it, so one groupby gives every column
+    parts = {}
+    for column in numeric_columns:
+        if column in rate_columns:
+            has_rate = data[column].notna()
+            parts[column] = data[column].astype('float64') * weights.where(has_rate)
+            parts[(column, 'weight')] = weights.where(has_rate)
+        else:
+            parts[column] = data[column]
+
+    sums = pd.DataFrame(parts).groupby(data['continent'].astype(str).to_numpy(), sort=True).sum(min_count=1)
+    sums.loc[WORLD] = sums.sum(min_count=1)
+
+    rolled = pd.DataFrame({'infection': infection, 'continent': sums.index}, index=sums.index)
+
+    for column in numeric_columns:
+        if column in rate_columns:
+            rolled[column] = sums[column] / sums[(column, 'weight')]
+        else:
+            rolled[column] = sums[column]
+
+    rolled = rolled.reset_index(drop=True)
+    rolled['infection'] = rolled['infection'].astype('category')
+    rolled['continent'] = rolled['continent'].astype('category')
+
+    return rolled
+
+
+# Returns the continent data of a dataframe or Dataset as a Dataset: panepi data as it is, and country data rolled up.
+# Country data is only rolled up once per dataframe
+def continent_dataset(data):
+
+    dataset = dl.dataset_of(data)
+
+    if 'iso_code' not in dataset.dataframe.columns:
+        return dataset
+
+    rollups = dtl.dataframe_cache(_rollups, dataset.dataframe)
+
+    if 'dataset' not in rollups:
+        rollups['dataset'] = dl.Dataset(rollup_countries(dataset.dataframe))
+
+    return rollups['dataset']
+
+
+# Loads a csv file of country data rolled up to continents. The rolled up data is cached on disk for each version of
+# the file, so it's only worked out again once the file changes
+def load_rollup(datafile, cache_dir=dl.CACHE_DIR):
+
+    store_directory = dl.store_path(datafile, cache_dir) + '-rollup'
+    dl.build_store(lambda: rollup_countries(dl.load_csv(datafile, cache_dir)), store_directory, cache_dir)
+
+    return columnstore.read_columns(store_directory)
+
+
+""" Test Code """
+
+# Test 1: Prints total deaths and cases per million for each continent, rolled up from 'covid-data.csv'
+# print(load_rollup('datafiles/covid-data.csv')[['continent', 'total_deaths', 'total_cases_per_million']])
+
+# Test 2: Graphs total deaths in Africa and Europe straight from the country data
+# import visualizers as vs
+# covid_df = dl.load_csv('datafiles/covid-data.csv')
+# vs.comp_infec_between_continents(covid_df, 'COVID19', 'Africa', 'Europe', 'total_deaths')
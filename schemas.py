@@ -0,0 +1,112 @@
+"""
+GENERAL INFORMATION
+
+Name: schemas.py
+
+Description: Describes the columns of each family of csv datafiles, so they can be loaded with compact column types
+and checked once when they are loaded. There are two families:
+
+    covid     one row per country (and date), keyed by iso code: 'covid-data.csv' and the OWID source files
+    panepi    one row per infection and continent: 'panepi-data.csv'
+
+A file's family is recognised by its first column. Each family lists:
+
+    key          the first column of the family's files
+    required     columns the visualizers can't work without. Loading a file without them fails straight away
+    categories   text columns with few distinct values, stored as categories rather than one string per row
+    float32      rates and other columns where single precision is plenty. Counts such as total_cases or population
+                 go past the 16 million whole numbers float32 can hold exactly, so they stay float64
+    suffixes     columns ending in one of these are float32 too (e.g. the many '_per_million' OWID columns)
+
+Columns a family doesn't mention keep the types pandas picks for them. Editing a schema changes SCHEMA_VERSION, which
+makes dataloader.py parse cached files again with the new types.
+
+Testing: Example function calls are provided at the bottom to test code functionality.
+
+"""
+
+
+import hashlib
+import json
+
+
+SCHEMAS = {'covid': {'key': 'iso_code',
+                     'required': ['iso_code', 'continent', 'location'],
+                     'categories': ['iso_code', 'continent', 'location', 'date', 'tests_units'],
+                     'float32': ['reproduction_rate', 'population_density', 'median_age', 'aged_65_older',
+                                 'aged_70_older', 'gdp_per_capita', 'extreme_poverty', 'cardiovasc_death_rate',
+                                 'diabetes_prevalence', 'female_smokers', 'male_smokers', 'handwashing_facilities',
+                                 'life_expectancy', 'human_development_index', 'stringency_index', 'positive_rate',
+                                 'tests_per_case'],
+                     'suffixes': ['_per_million', '_per_thousand', '_per_hundred']},
+           'panepi': {'key': 'infection',
+                      'required': ['infection', 'continent'],
+                      'categories': ['infection', 'continent'],
+                      'float32': ['duration_in_years', 'deaths_per_million'],
+                      'suffixes': ['_per_million']}}
+
+
+# Changes whenever a schema is edited
+SCHEMA_VERSION = hashlib.sha256(json.dumps(SCHEMAS, sort_keys=True).encode()).hexdigest()[:12]
+
+
+# Returns the family of a file from its column names, or None if it isn't one of the known families
+def detect_family(columns):
+
+    for family, schema in SCHEMAS.items():
+        if columns and columns[0] == schema['key']:
+            return family
+
+    return None
+
+
+# Raises a ValueError naming any required columns of a family that are missing
+def validate_columns(family, columns, datafile='the file'):
+
+    if family is None:
+        return
+
+    missing = [column for column in SCHEMAS[family]['required'] if column not in columns]
+
+    if missing:
+        raise ValueError(str(datafile) + " looks like " + family + " data, but is missing the columns: " +
+                         ", ".join(missing))
+
+
+# Checks whether a column of a family holds a rate or other per-person measure (the float32 columns) rather than a
+# count
+def is_rate_column(family, column):
+
+    schema = SCHEMAS[family]
+
+    return column in schema['float32'] or column.endswith(tuple(schema['suffixes']))
+
+
+# Returns the column types to read a file of a family with, for the columns the file has. Categories can be left out,
+# e.g. when a file is read in chunks that would each get different categories
+def column_dtypes(family, columns, categories=True):
+
+    if family is None:
+        return {}
+
+    schema = SCHEMAS[family]
+    dtypes = {}
+
+    for column in columns:
+        if categories and column in schema['categories']:
+            dtypes[column] = 'category'
+        elif is_rate_column(family, column):
+            dtypes[column] = 'float32'
+
+    return dtypes
+
+
+""" Test Code """
+
+# Test 1: Prints the family of 'covid-data.csv' and the types its columns are read with
+# import dataloader as dl
+# headers = dl.read_headers('datafiles/covid-data.csv')
+# print(detect_family(headers), column_dtypes(detect_family(headers), headers))
+
+# Test 2: Fails, because a covid file needs a continent and location column
+# validate_columns('covid', ['iso_code', 'date'], 'example.csv')
@@ -0,0 +1,160 @@
+"""
+GENERAL INFORMATION
+
+Name: timeseries.py
+
+Description: Keeps every (iso_code, date) observation from a raw OWID data file, rather than only the last one per
+country (see data_cleaning.prune_data). The observations are held in flat numpy arrays sorted by country and then by
+date, so each country's data sits in one contiguous block. A query for one country over a window of dates is two
+binary searches and a slice, however many rows the file has.
+
+A time series store can be saved as a column store (see columnstore.py) and memory-mapped back in, so the raw file
+only needs to be parsed once.
+
+Testing: Example function calls are provided at the bottom to test code functionality.
+
+"""
+
+
+import json
+import os
+
+import columnstore
+import dataloader as dl
+import schemas
+from lazyimport import lazy_import
+
+# Imported the first time data is read or written (see lazyimport.py)
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+
+# Name of the file listing where each country's block of rows starts and ends in a saved store
+BLOCKS_FILE = 'blocks.json'
+
+
+class TimeSeriesStore:
+
+    # Takes a dataframe of observations that is already sorted by iso code and then by date. The dates are kept
+    # separately as an array of days, unless they are given
+    def __init__(self, dataframe, dates=None, blocks=None):
+
+        self.dataframe = dataframe
+
+        if dates is None:
+            dates = dataframe['date'].to_numpy().astype('datetime64[D]')
+
+        self.dates = dates
+
+        # Work out where each country's block of rows starts and ends, if not already known
+        if blocks is None:
+            iso_codes = dataframe['iso_code'].to_numpy()
+            starts = np.flatnonzero(np.r_[True, iso_codes[1:] != iso_codes[:-1]]) if len(iso_codes) else []
+            ends = list(starts[1:]) + [len(iso_codes)]
+            blocks = {str(iso_codes[start]): (int(start), int(end)) for start, end in zip(starts, ends)}
+
+        self.blocks = blocks
+
+    # Builds a store from a raw OWID csv file, reading it a chunk at a time. Only the named statistics are kept if a
+    # list of stats is given
+    @classmethod
+    def from_csv(cls, source_file="sourcedata/owid-covid-data.csv", stats=None, chunk_size=100000):
+
+        usecols = None
+        if stats is not None:
+            usecols = ['iso_code', 'date'] + [stat for stat in stats if stat not in ('iso_code', 'date')]
+
+        chunks = []
+        # Read the numbers with the covid schema's column types. The text columns become categories once every chunk
+        # has been read
+        headers = usecols if usecols is not None else dl.read_headers(source_file)
+        dtypes = schemas.column_dtypes('covid', headers, categories=False)
+
+        for chunk in pd.read_csv(source_file, usecols=usecols, dtype=dtypes, chunksize=chunk_size):
+            chunk['date'] = pd.to_datetime(chunk['date'])
+            chunks.append(chunk)
+
+        dataframe = pd.concat(chunks, ignore_index=True)
+
+        # Store the text columns as categories, to keep the store compact
+        for column in dataframe.columns:
+            if column != 'date' and not pd.api.types.is_numeric_dtype(dataframe[column]):
+                dataframe[column] = dataframe[column].astype('category')
+
+        # Sort by country and then by date. A stable sort keeps the file's order for duplicate dates
+        dataframe.sort_values(by=['iso_code', 'date'], kind='stable', inplace=True, ignore_index=True)
+
+        return cls(dataframe)
+
+    # Saves the store as a column store directory
+    def save(self, directory):
+
+        # Dates are saved as a count of days
+        dataframe = self.dataframe.copy()
+        dataframe['date'] = self.dates.astype(np.int64)
+
+        columnstore.write_columns(dataframe, directory)
+
+        with open(os.path.join(directory, BLOCKS_FILE), 'w') as json_file:
+            json.dump(self.blocks, json_file)
+
+    # Loads a store saved with save(), memory-mapping its columns
+    @classmethod
+    def load(cls, directory):
+
+        dataframe = columnstore.read_columns(directory)
+
+        # Read the saved count of days back as dates, without copying them out of the mapped file
+        dates = dataframe['date'].to_numpy().view('datetime64[D]')
+
+        with open(os.path.join(directory, BLOCKS_FILE)) as json_file:
+            blocks = {iso_code: tuple(block) for iso_code, block in json.load(json_file).items()}
+
+        return cls(dataframe, dates, blocks)
+
+    # Lists the iso codes in the store
+    def iso_codes(self):
+        return list(self.blocks.keys())
+
+    # Finds the rows of a country between two dates (inclusive). Returns a (start, end) pair of row positions
+    def row_range(self, iso_code, start_date=None, end_date=None):
+
+        if iso_code not in self.blocks:
+            raise KeyError("No data for iso code '" + str(iso_code) + "'")
+
+        start, end = self.blocks[iso_code]
+        country_dates = self.dates[start:end]
+
+        # The country's dates are sorted, so the window can be found with a binary search at each end
+        if start_date is not None:
+            start = start + int(np.searchsorted(country_dates, np.datetime64(start_date, 'D'), side='left'))
+        if end_date is not None:
+            end = end - len(country_dates) + int(np.searchsorted(country_dates, np.datetime64(end_date, 'D'),
+                                                                 side='right'))
+
+        return start, max(start, end)
+
+    # Returns the dates and values of a statistic for a country between two dates (inclusive), as array slices
+    def series(self, iso_code, stat, start_date=None, end_date=None):
+
+        start, end = self.row_range(iso_code, start_date, end_date)
+
+        return self.dates[start:end], self.dataframe[stat].to_numpy()[start:end]
+
+    # Returns every column of a country between two dates (inclusive), as a dataframe
+    def query(self, iso_code, start_date=None, end_date=None):
+
+        start, end = self.row_range(iso_code, start_date, end_date)
+
+        rows = self.dataframe.iloc[start:end].copy()
+        rows['date'] = self.dates[start:end]
+
+        return rows
+
+
+""" Test Code """
+
+# Test 1: Builds a store of total cases per million from the raw OWID data, and prints the United States' figures
+# for 2021
+# store = TimeSeriesStore.from_csv(stats=['location', 'continent', 'total_cases_per_million'])
+# print(store.series('USA', 'total_cases_per_million', '2021-01-01', '2021-12-31'))
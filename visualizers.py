@@ -6,253 +6,524 @@ Name: visualizers.py
 Description: Contains multiple functions that read cleaned, global data about a single infection (in this case COVID-19)
 or data about multiple pandemics and epidemics, and provides different ways to visualize the data graphically.
 
+Each visualizer takes either a dataframe or a dataloader.Dataset. Passing the same Dataset to many visualizers lets
+them reuse its indexes, so each graph only copies the rows it displays. The comparison visualizers can also draw on
+axes they're given rather than a graph of their own, which lets a dashboard lay several of them out as panels of one
+figure.
+
 NB: The single-infection visualizers can read any csv file formatted with 'iso_codes' in the first column.
 The example file, 'covid-data.csv', is formatted in this manner.
 
 The multiple-infection visualizers can read any csv file formatted with 'infection' and 'continent' in the first two
-columns. The example file, 'panepi-data.csv', is formatted in this manner.
+columns. The example file, 'panepi-data.csv', is formatted in this manner. They can also read the same files as the
+single-infection visualizers, which are rolled up to one row per continent (see rollup.py) for the infection 'COVID19'.
 
 Testing: Example function calls are provided at the bottom to test code functionality.
 
 """
 
 
-import pandas as pd
-import matplotlib.pyplot as plt
 import datatoolslib as dtl  # See "Test Code" at the bottom for usage
+import dataloader as dl
+import profiler as prof
+import rollup
+from lazyimport import lazy_import
 
+# Imported the first time a graph is drawn (see lazyimport.py)
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+plt = lazy_import('matplotlib.pyplot')
+mcollections = lazy_import('matplotlib.collections')
 
-""" Single-Infection Visualizers (Country-Based) """
 
+# Whether graphs are displayed on screen. Set to False by batchrender.py to draw graphs without a display
+INTERACTIVE = True
 
-# Compares a piece of statistical data about one infection between up to three different locations
-def comp_infec_between_countries(dataframe, stat, iso_code1, iso_code2=None, iso_code3=None):
+# The most bars drawn by pandas with one label each. Graphs with more bars are drawn as a single collection, with
+# only some of the bars labelled
+MAX_LABELLED_BARS = 60
 
-    # Store dataframe
-    infec_data = dataframe
 
-    # Copy dataframe to avoid permanent manipulations
-    data_copy = infec_data.copy()
+""" Single-Infection Visualizers (Country-Based) """
 
-    # Set the index to 'iso_code' to make user query easier, and to make the codes display on the graph
-    data_copy.set_index('iso_code', inplace=True)
 
-    # If only one iso code has been entered, slice the dataframe by that code
-    if iso_code3 is iso_code2 is None:
-        country_comp = data_copy.loc[[iso_code1]]
+# Compares a piece of statistical data about one infection between up to three different locations
+def comp_infec_between_countries(dataframe, stat, iso_code1, iso_code2=None, iso_code3=None, axes=None):
 
-    # If two iso codes have been entered, slice the dataframe by those codes
-    elif iso_code3 is None:
-        country_comp = data_copy.loc[[iso_code1, iso_code2]]
+    with prof.span('slice'):
+        # Store dataset
+        infec_data = dl.dataset_of(dataframe)
 
-    # If three iso codes have been entered, slice the dataframe by those codes
-    else:
-        country_comp = data_copy.loc[[iso_code1, iso_code2, iso_code3]]
+        # Store all the iso codes that have been entered
+        iso_codes = [iso_code for iso_code in (iso_code1, iso_code2, iso_code3) if iso_code is not None]
 
-    # Plot the collection of country data with the y-axis being the user's chosen statistic
-    plt.ion()
-    country_comp.plot(kind='bar', y=stat)
+        # Slice the rows for those codes out of the dataset, and set the index to 'iso_code' to make the codes
+        # display on the graph
+        country_comp = infec_data.select('iso_code', iso_codes).set_index('iso_code')
 
-    # Store the y-axis label as the chosen statistic
-    y_axis_label = stat.title().replace("_", " ")
+    with prof.span('plot'):
+        # Plot the collection of country data with the y-axis being the user's chosen statistic
+        plt.ion()
+        graph = country_comp.plot(kind='bar', y=stat, ax=axes)
 
-    # Label the x and y-axes, and title the graph
-    plt.xlabel('Country', fontsize=14)
-    plt.ylabel(y_axis_label, fontsize=14)
-    plt.title(y_axis_label + " by Country")
+        # Store the y-axis label as the chosen statistic
+        y_axis_label = stat.title().replace("_", " ")
 
-    # Show the graph
-    plt.show()
-    plt.pause(30)
+        # Label the x and y-axes, and title the graph
+        graph.set_xlabel('Country', fontsize=14)
+        graph.set_ylabel(y_axis_label, fontsize=14)
+        graph.set_title(y_axis_label + " by Country")
+
+    # Show the graph, unless it was drawn on a dashboard's axes
+    return display_graph(axes)
 
 
 # Compares a piece of statistical data about one infection across all countries. Allows the user to view a subset of
 # the first few countries
-def infec_stat_all_countries(dataframe, sample_size, stat, top=False, bottom=False):
+def infec_stat_all_countries(dataframe, sample_size, stat, top=False, bottom=False, axes=None):
+
+    with prof.span('slice'):
+        # Store dataframe. Only the selected rows are copied, so the original is never changed
+        data_copy = dl.dataset_of(dataframe).dataframe
+
+        # Pick out the rows with the highest or lowest stats, in order. Only the chosen rows are sorted, rather than
+        # the whole dataframe
+        if top is True or bottom is True:
+            values = data_copy[stat].to_numpy(dtype=float, na_value=np.nan)
+            data_copy = data_copy.take(top_k_positions(values, sample_size, largest=top is True))
+
+        # Otherwise keep the data in its original (alphabetical) order, taking the first few rows if a sample is
+        # requested
+        elif sample_size is not None:
+            data_copy = data_copy.head(sample_size)
+
+    with prof.span('plot'):
+        plt.ion()
 
-    # Store dataframe
-    infec_data = dataframe
+        # Plot the graph with the y-axis being the user's chosen statistic. Very many countries are drawn as a single
+        # collection of bars, which pandas' bar plot would be too slow (and unreadable) for
+        if len(data_copy) > MAX_LABELLED_BARS:
+            graph = plot_many_bars(data_copy['iso_code'].to_numpy(),
+                                   data_copy[stat].to_numpy(dtype=float, na_value=np.nan), stat, axes)
+        else:
+            # Set the index to 'iso_code' to make the codes display on the graph
+            graph = data_copy.set_index('iso_code').plot(kind='bar', y=stat, ax=axes)
 
-    # Copy dataframe to avoid permanent manipulations
-    data_copy = infec_data.copy()
+        # Store the y-axis label as the chosen statistic
+        y_axis_label = stat.title().replace("_", " ")
 
-    # Decide whether to sort the data by highest stats, lowest stats, or alphabetically
-    if top is True:
-        data_copy.sort_values(by=[stat], inplace=True, ascending=False)
-    elif bottom is True:
-        data_copy.sort_values(by=[stat], inplace=True)
+        # Label the x and y-axes, and title the graph
+        graph.set_xlabel('Country', fontsize=14)
+        graph.set_ylabel(y_axis_label, fontsize=14)
+        graph.set_title(y_axis_label + " by Country")
 
-    # Display only a sample of the data, if requested
-    if sample_size is not None:
-        # Take the first few rows of data
-        subsample = data_copy.head(sample_size)
+    # Show the graph, unless it was drawn on a dashboard's axes
+    return display_graph(axes)
 
-        # Set the index to 'iso_code' to make the codes display on the graph
-        subsample.set_index('iso_code', inplace=True)
 
-        # Plot the graph with the y-axis being the user's chosen statistic
+""" Multiple-Infection Visualizers (Continent-Based) """
+
+
+# Compares a piece of statistical data between two different infections in a given continent
+def comp_infec_in_continent(dataframe, continent, infection1, infection2, stat, axes=None):
+
+    with prof.span('slice'):
+        # Store dataset, rolling country data up to continents
+        panepi_data = rollup.continent_dataset(dataframe)
+
+        # Store all data related to the two chosen infections for the chosen continent, with the index set to
+        # 'infection'
+        infection_comp = panepi_data.select(('infection', 'continent'),
+                                            [(infection1, continent), (infection2, continent)]).set_index('infection')
+
+    with prof.span('plot'):
+        # Plot the data with the y-axis being the chosen statistic
         plt.ion()
-        subsample.plot(kind='bar', y=stat)
+        graph = infection_comp.plot(kind='bar', y=stat, ax=axes)
+
+        # Store the y-axis label as the chosen statistic
+        y_axis_label = stat.title().replace("_", " ")
+
+        # Label the x and y-axes, and title the graph
+        graph.set_xlabel('Infection', fontsize=14)
+        graph.set_ylabel(y_axis_label, fontsize=14)
+        graph.set_title(y_axis_label + " of " + infection1 + " and " + infection2 + " in " + continent)
+
+    # Show the graph, unless it was drawn on a dashboard's axes
+    return display_graph(axes)
+
+
+# Compares a piece of statistical data about a given virus in two different continents
+def comp_infec_between_continents(dataframe, infection, continent1, continent2, stat, axes=None):
+
+    with prof.span('slice'):
+        # Store dataset, rolling country data up to continents
+        panepi_data = rollup.continent_dataset(dataframe)
 
-    else:
-        data_copy.set_index('iso_code', inplace=True)
+        # Store all data related to the two chosen continents for the chosen infection, with the index set to
+        # 'continent'
+        continent_comp = panepi_data.select(('infection', 'continent'),
+                                            [(infection, continent1), (infection, continent2)]).set_index('continent')
 
-        # Plot the graph with the y-axis being the user's chosen statistic
+    with prof.span('plot'):
+        # Plot the data with the y-axis being the chosen statistic
         plt.ion()
-        data_copy.plot(kind='bar', y=stat)
+        graph = continent_comp.plot(kind='bar', y=stat, ax=axes)
 
-    # Store the y-axis label as the chosen statistic
-    y_axis_label = stat.title().replace("_", " ")
+        # Store the y-axis label as the chosen statistic
+        y_axis_label = stat.title().replace("_", " ")
 
-    # Label the x and y-axes, and title the graph
-    plt.xlabel('Country', fontsize=14)
-    plt.ylabel(y_axis_label, fontsize=14)
-    plt.title(y_axis_label + " by Country")
+        # Label the x and y-axes, and title the graph
+        graph.set_xlabel('Location', fontsize=14)
+        graph.set_ylabel(y_axis_label, fontsize=14)
+        graph.set_title(y_axis_label + " of " + infection + " in " + continent1 + " and " + continent2)
 
-    # Show the graph
-    plt.show()
-    plt.pause(30)
+    # Show the graph, unless it was drawn on a dashboard's axes
+    return display_graph(axes)
 
 
-""" Multiple-Infection Visualizers (Continent-Based) """
+# Compares a given stat about two different infections in two different continents
+def multi_comp(dataframe, infec1, infec2, continent1, continent2, stat, axes=None):
+    return multi_comp_grid(dataframe, stat, [infec1, infec2], [continent1, continent2], axes)
 
 
-# Compares a piece of statistical data between two different infections in a given continent
-def comp_infec_in_continent(dataframe, continent, infection1, infection2, stat):
+# Compares a given stat about any number of infections in any number of continents, as a grouped bar graph. Every
+# infection (or continent) in the data is used if no list of infections (or continents) is given
+def multi_comp_grid(dataframe, stat, infections=None, continents=None, axes=None):
 
-    # Store dataframe
-    panepi_data = dataframe
+    with prof.span('slice'):
+        # Store dataset, rolling country data up to continents
+        panepi_data = rollup.continent_dataset(dataframe)
 
-    # Copy dataframe to avoid permanent data manipulation
-    data_copy = panepi_data.copy()
+        if infections is None:
+            infections = list(panepi_data.index('infection').keys())
+        if continents is None:
+            continents = list(panepi_data.index('continent').keys())
 
-    # Store all data related to the chosen continent
-    continent_group = data_copy[data_copy.continent == continent]
+        # Store all data related to the chosen infections, for the chosen continents
+        infection_data = panepi_data.select('infection', infections)
+        infection_data = infection_data[infection_data.continent.isin(continents)]
 
-    # Set the index to 'infection' to make querying the chosen infections easier
-    continent_group.set_index('infection', inplace=True)
+        # Build a table of the chosen statistic in one pass, with a row per infection and a column per continent, in
+        # the order they were chosen. Combinations with no data are left as NaN
+        infec_comp_df = infection_data.pivot_table(index='infection', columns='continent', values=stat, aggfunc='first',
+                                                   observed=True)
+        infec_comp_df = infec_comp_df.reindex(index=infections, columns=continents)
 
-    # Store all data related to the two chosen infections for the chosen continent
-    infection_comp = continent_group.loc[[infection1, infection2]]
+        # Report every combination with no data at once, and graph them as 0
+        missing_data = infec_comp_df.isna()
+        if missing_data.values.any():
+            missing_cells = missing_data.stack()
+            missing_cells = missing_cells[missing_cells]
+            print("NOTE: No data for these values: " +
+                  "; ".join(continent + ", " + infection for infection, continent in missing_cells.index))
 
-    # Plot the data with the y-axis being the chosen statistic
-    plt.ion()
-    infection_comp.plot(kind='bar', y=stat)
+        infec_comp_df = infec_comp_df.fillna(0)
 
-    # Store the y-axis label as the chosen statistic
-    y_axis_label = stat.title().replace("_", " ")
+    with prof.span('plot'):
+        # Plot a grouped bar graph with the infections on the x-axis, and a bar for each continent's data
+        plt.ion()
+        graph = infec_comp_df.plot(y=continents, kind='bar', ax=axes)
 
-    # Label the x and y-axes, and title the graph
-    plt.xlabel('Infection', fontsize=14)
-    plt.ylabel(y_axis_label, fontsize=14)
-    plt.title(y_axis_label + " of " + infection1 + " and " + infection2 + " in " + continent)
+        # Store the y-axis label as the chosen statistic
+        y_axis_label = stat.title().replace("_", " ")
 
-    # Show the graph
-    plt.show()
-    plt.pause(30)
+        # Label the x and y-axes, and title the graph
+        graph.set_xlabel('Infection', fontsize=11)
+        graph.set_ylabel(y_axis_label, fontsize=11)
+        graph.set_title(y_axis_label + " of " + join_names(infections) + " in " + join_names(continents), fontsize=11)
 
+    # Show the graph, unless it was drawn on a dashboard's axes
+    return display_graph(axes)
 
-# Compares a piece of statistical data about a given virus in two different continents
-def comp_infec_between_continents(dataframe, infection, continent1, continent2, stat):
 
-    # Store dataframe
-    panepi_data = dataframe
+""" Time-Series Visualizers (Country-Based, see timeseries.py) """
+
 
-    # Copy dataframe to avoid permanent data manipulation
-    data_copy = panepi_data.copy()
+# The most countries that can be drawn on one time-series graph
+MAX_TIME_SERIES_COUNTRIES = 10
 
-    # Store all data related to the chosen infection
-    infection_group = data_copy[data_copy.infection == infection]
 
-    # Set the index to 'continent' to make querying the chosen continents easier
-    infection_group.set_index('continent', inplace=True)
+# Plots a piece of statistical data about one infection over time for a list of countries, optionally between two
+# dates. Reads from a TimeSeriesStore rather than a dataframe
+def stat_over_time(store, stat, iso_codes, start_date=None, end_date=None):
 
-    # Store all data related to the two chosen continents for the chosen infection
-    continent_comp = infection_group.loc[[continent1, continent2]]
+    # Allow a single iso code to be passed as a string
+    if isinstance(iso_codes, str):
+        iso_codes = [iso_codes]
+
+    if len(iso_codes) > MAX_TIME_SERIES_COUNTRIES:
+        raise ValueError("Up to " + str(MAX_TIME_SERIES_COUNTRIES) + " countries can be plotted at once")
+
+    with prof.span('plot'):
+        plt.ion()
+        figure, axes = plt.subplots()
 
-    # Plot the data with the y-axis being the chosen statistic
-    plt.ion()
-    continent_comp.plot(kind='bar', y=stat)
+        # Draw one line per country. Each series is a slice of the store, found by binary search
+        for iso_code in iso_codes:
+            dates, values = store.series(iso_code, stat, start_date, end_date)
+            axes.plot(dates, values, label=iso_code)
 
-    # Store the y-axis label as the chosen statistic
-    y_axis_label = stat.title().replace("_", " ")
+        axes.legend()
+        figure.autofmt_xdate()
 
-    # Label the x and y-axes, and title the graph
-    plt.xlabel('Location', fontsize=14)
-    plt.ylabel(y_axis_label, fontsize=14)
-    plt.title(y_axis_label + " of " + infection + " in " + continent1 + " and " + continent2)
+        # Store the y-axis label as the chosen statistic
+        y_axis_label = stat.title().replace("_", " ")
+
+        # Label the x and y-axes, and title the graph
+        plt.xlabel('Date', fontsize=14)
+        plt.ylabel(y_axis_label, fontsize=14)
+        plt.title(y_axis_label + " over Time")
 
     # Show the graph
-    plt.show()
-    plt.pause(30)
+    return display_graph()
 
 
-# Compares a given stat about two different infections in two different continents
-def multi_comp(dataframe, infec1, infec2, continent1, continent2, stat):
+""" Dashboards """
+
 
-    # Store dataframe
-    panepi_data = dataframe
+# How many panels a dashboard places side by side, and the size of each panel in inches
+DASHBOARD_COLUMNS = 2
+PANEL_SIZE = (6.4, 4.8)
 
-    # Copy dataframe to avoid permanent data manipulation
-    data_copy = panepi_data.copy()
+# Space around the panels in inches (with room for a title at the top), and between them as a fraction of a panel.
+# The space below each row grows to fit its labels once the panels are drawn (see fit_panel_labels), which is much
+# faster than fitting every label with matplotlib's constrained layout
+PANEL_MARGINS = {'left': 1.0, 'right': 0.3, 'bottom': 1.3, 'top': 0.5, 'title': 0.4}
+PANEL_GAPS = {'wspace': 0.25, 'hspace': 0.55}
 
-    # Set the index to 'infection' to make querying the chosen infections easier
-    data_copy.set_index('infection', inplace=True)
+# Space left between a row's labels and the edge of the figure or the titles of the next row, in inches
+LABEL_PADDING = 0.1
 
-    # Store all data related to the two chosen infections
-    infection_data = data_copy.loc[[infec1, infec2]]
 
-    # Store all data concerning both infections for each continent
-    cont1_data = infection_data[infection_data.continent == continent1]
-    cont2_data = infection_data[infection_data.continent == continent2]
+# Draws several comparisons as the panels of a single figure, e.g. a comp_infec_between_countries graph for each of
+# several stats plus a multi_comp graph, so a report is set up, shown and saved once rather than once per graph. Each
+# panel is a job as used by batchrender.py, e.g. {'visualizer': 'v1', 'args': ['total_deaths', 'USA', 'CAN']}. The
+# data is indexed (and rolled up to continents) once for every panel. Panels graphing the same stat at the same level
+# (countries or continents) share their y-axis, so their bars can be compared by eye
+def dashboard(dataframe, panels, columns=DASHBOARD_COLUMNS, title=None, share_y=True):
 
-    # Store the integer value of the chosen statistic for each continent, for each infection. Adjust for NaN values.
-    cont1_infec1 = nan_checker(cont1_data, infec1, stat, continent1)
-    cont1_infec2 = nan_checker(cont1_data, infec2, stat, continent1)
-    cont2_infec1 = nan_checker(cont2_data, infec1, stat, continent2)
-    cont2_infec2 = nan_checker(cont2_data, infec2, stat, continent2)
+    if not panels:
+        raise ValueError("A dashboard needs at least one panel")
 
-    # Create a dictionary such that its dataframe will have the following columns: the chosen infections, the chosen
-    # infection stats for continent 1, and the chosen infection stats for continent two
-    final_infec_comp_data = {'infection': [infec1, infec2], continent1: [cont1_infec1, cont1_infec2],
-                             continent2: [cont2_infec1, cont2_infec2]}
+    # Check every panel before anything is drawn
+    visualizers = [panel_visualizer(panel) for panel in panels]
 
-    # Create a new dataframe from the dictionary
-    infec_comp_df = pd.DataFrame(data=final_infec_comp_data)
+    with prof.span('slice'):
+        # Index the data once, for every panel
+        dataset = dl.dataset_of(dataframe)
 
-    # Plot a double-bar graph with the infections on the x-axis, and the two continents' data on the y-axis
-    plt.ion()
-    infec_comp_df.plot(x='infection', y=[continent1, continent2], kind='bar')
+    with prof.span('plot'):
+        plt.ion()
 
-    # Store the y-axis label as the chosen statistic
-    y_axis_label = stat.title().replace("_", " ")
+        columns = max(1, min(columns, len(panels)))
+        rows = -(-len(panels) // columns)
 
-    # Label the x and y-axes, and title the graph
-    plt.xlabel('Infection', fontsize=11)
-    plt.ylabel(y_axis_label, fontsize=11)
-    plt.title(y_axis_label + " of " + infec1 + " and " + infec2 + " in " + continent1 + " and " + continent2,
-              fontsize=11)
+        width, height = PANEL_SIZE[0] * columns, PANEL_SIZE[1] * rows
+        top = PANEL_MARGINS['top'] + (PANEL_MARGINS['title'] if title is not None else 0)
+
+        figure, grid = plt.subplots(rows, columns, squeeze=False, figsize=(width, height),
+                                    gridspec_kw=dict(PANEL_GAPS, left=PANEL_MARGINS['left'] / width,
+                                                     right=1 - PANEL_MARGINS['right'] / width,
+                                                     bottom=PANEL_MARGINS['bottom'] / height, top=1 - top / height))
+
+        # Remove the spare places in the last row
+        panel_axes = list(grid.flat[:len(panels)])
+        for spare in grid.flat[len(panels):]:
+            spare.remove()
+
+        if title is not None:
+            figure.suptitle(title, fontsize=16)
+
+    # Each visualizer slices its rows out of the shared dataset and draws on its own panel
+    for panel, visualizer, axes in zip(panels, visualizers, panel_axes):
+        visualizer(dataset, *panel.get('args', []), axes=axes, **panel.get('kwargs', {}))
+
+    if share_y:
+        with prof.span('plot'):
+            levels = ['Country' if visualizer in COUNTRY_VISUALIZERS else 'Continent' for visualizer in visualizers]
+            share_y_axes(panel_axes, levels)
+
+    with prof.span('plot'):
+        fit_panel_labels(figure, panel_axes, columns)
+
+    # Show the whole dashboard at once
+    return display_graph()
 
-    # Show the graph
-    plt.show()
-    plt.pause(30)
+
+# Returns the visualizer a dashboard panel asks for, raising a ValueError for one that can't be a panel
+def panel_visualizer(panel):
+
+    visualizer = VISUALIZERS.get(panel.get('visualizer'))
+
+    if visualizer not in PANEL_VISUALIZERS:
+        raise ValueError("Visualizer '" + str(panel.get('visualizer')) + "' can't be drawn on a dashboard")
+
+    return visualizer
+
+
+# Makes panels at the same level that graph the same stat (going by their y-axis labels) share one y-axis, scaled to
+# fit all of their bars
+def share_y_axes(panel_axes, levels):
+
+    groups = {}
+    for axes, level in zip(panel_axes, levels):
+        groups.setdefault((level, axes.get_ylabel()), []).append(axes)
+
+    for group in groups.values():
+        if len(group) > 1:
+            for axes in group[1:]:
+                axes.sharey(group[0])
+            group[0].autoscale_view(scalex=False)
+
+
+# Makes room for long tick labels (e.g. rotated continent names) below each row of panels, growing the bottom margin
+# and the gap between rows where the labels don't fit. The labels hang below their panels by the same height however
+# the panels are placed, so they are measured once, for the whole dashboard
+def fit_panel_labels(figure, panel_axes, columns):
+
+    renderer = figure.canvas.get_renderer()
+    height = figure.get_figheight()
+    rows = -(-len(panel_axes) // columns)
+
+    # How far (in inches) each row's labels reach below its panels, and its titles above them
+    below, above = [0] * rows, [0] * rows
+    for position, axes in enumerate(panel_axes):
+        row = position // columns
+        panel, labelled = axes.get_position(), axes.get_tightbbox(renderer)
+        below[row] = max(below[row], panel.y0 * height - labelled.y0 / figure.dpi)
+        above[row] = max(above[row], labelled.y1 / figure.dpi - panel.y1 * height)
+
+    grid = panel_axes[0].get_gridspec()
+    spacing = grid.get_subplot_params(figure)
+    bottom = max(spacing.bottom * height, below[-1] + LABEL_PADDING)
+
+    # Turn the widest gap the rows need into a fraction of a panel's height, as matplotlib measures it
+    hspace = spacing.hspace
+    if rows > 1:
+        gap = max(below[row] + above[row + 1] for row in range(rows - 1)) + LABEL_PADDING
+        space = spacing.top * height - bottom
+        hspace = max(hspace, gap * rows / (space - gap * (rows - 1)))
+
+    grid.update(bottom=bottom / height, hspace=hspace)
 
 
 """ Assistive Functions (Not for direct user interaction) """
 
 
-# Checks for a NaN value in a slice of data and adjusts before graphing. For multi_comp.
-def nan_checker(data, infec, stat, continent):
+# Shows the current graph on screen for 30 seconds, unless graphs are being rendered headlessly (see
+# batchrender.py), and returns its figure so it can be saved or closed. A graph drawn on axes given by the caller
+# (a dashboard panel) is left for the caller to show, and the figure holding the axes is returned
+def display_graph(axes=None):
+
+    if axes is not None:
+        return axes.figure
+
+    figure = plt.gcf()
+
+    if INTERACTIVE:
+        # Draw the graph inside the span, since showing it in interactive mode returns before anything is drawn
+        with prof.span('render'):
+            figure.canvas.draw()
+            plt.show()
+
+        with prof.idle():
+            plt.pause(30)
+
+    return figure
+
+
+# Returns the positions of the k largest (or smallest) values, ordered from largest (or smallest), with any NaN values
+# last. Finds them with a partition, so only the k chosen values are sorted. Every value is ordered if k is None
+def top_k_positions(values, k=None, largest=True):
+
+    # Flip the values so the largest values come first when sorting in ascending order
+    keys = -values if largest else values
+
+    valid = np.flatnonzero(~np.isnan(keys))
+    missing = np.flatnonzero(np.isnan(keys))
+
+    if k is None:
+        k = len(keys)
 
-    # Slice data from dataframe
-    datapoint = (data.loc[[infec]])[stat].values
+    # Partition so the k chosen values come first (in no particular order), then sort only those
+    if k < len(valid):
+        valid = valid[np.argpartition(keys[valid], k - 1)[:k]] if k > 0 else valid[:0]
 
-    # Check if the value is NaN and replace with 0
-    if pd.isna(datapoint):
-        print("NOTE: No data for this value: " + continent + ", " + infec)
-        return 0
-    else:
-        return int(datapoint)  # Return an int of the value if not NaN
+    chosen = valid[np.argsort(keys[valid], kind='stable')]
+
+    return np.concatenate([chosen, missing[:max(0, k - len(chosen))]])
+
+
+# Draws a bar for each value as one collection of rectangles on the given axes (or a new graph), labelling an evenly
+# spaced selection of at most MAX_LABELLED_BARS bars, and returns the axes. Much faster than a pandas bar plot for
+# thousands of bars
+def plot_many_bars(labels, heights, stat, axes=None):
+
+    if axes is None:
+        figure, axes = plt.subplots()
+
+    # Draw missing and infinite values as empty bars, so they can't stretch the y-axis
+    heights = np.where(np.isfinite(heights), heights, 0)
+    positions = np.arange(len(heights))
+
+    # One rectangle per bar, as corners: bottom left, top left, top right, bottom right
+    left = positions - 0.4
+    right = positions + 0.4
+    corners = np.stack([np.stack([left, np.zeros_like(heights)], axis=1),
+                        np.stack([left, heights], axis=1),
+                        np.stack([right, heights], axis=1),
+                        np.stack([right, np.zeros_like(heights)], axis=1)], axis=1)
+
+    axes.add_collection(mcollections.PolyCollection(corners, linewidths=0, label=stat))
+    axes.autoscale_view()
+
+    # Label every nth bar, so the labels stay readable
+    step = max(1, int(np.ceil(len(labels) / MAX_LABELLED_BARS)))
+    axes.set_xticks(positions[::step])
+    axes.set_xticklabels([str(label) for label in labels[::step]], rotation=90)
+
+    # Place the legend in a fixed corner, since searching for the best spot is slow with this many bars
+    axes.legend(loc='upper right')
+
+    return axes
+
+
+# Joins a list of names into a phrase for a graph title, e.g. "COVID19, HIV and SPANISH FLU"
+def join_names(names):
+
+    names = [str(name) for name in names]
+
+    if len(names) <= 1:
+        return "".join(names)
+
+    return ", ".join(names[:-1]) + " and " + names[-1]
+
+
+""" Visualizer Keys """
+
+
+# Every visualizer that draws from a dataframe, by key (as used in main.py) and by function name. These are the ones
+# batch, command line and dashboard jobs can run. stat_over_time reads a TimeSeriesStore instead, so it's called
+# directly (see timeseries.py)
+VISUALIZERS = {'v1': comp_infec_between_countries,
+               'v2': infec_stat_all_countries,
+               'v3': comp_infec_in_continent,
+               'v4': comp_infec_between_continents,
+               'v5': multi_comp}
+
+# Visualizers that are only available by function name
+VISUALIZERS['multi_comp_grid'] = multi_comp_grid
+VISUALIZERS['dashboard'] = dashboard
+
+for _visualizer in list(VISUALIZERS.values()):
+    VISUALIZERS[_visualizer.__name__] = _visualizer
+
+# Visualizers that compare rows of a dataframe, which can be drawn as dashboard panels, and those of them that compare
+# countries rather than continents
+PANEL_VISUALIZERS = (comp_infec_between_countries, infec_stat_all_countries, comp_infec_in_continent,
+                     comp_infec_between_continents, multi_comp, multi_comp_grid)
+COUNTRY_VISUALIZERS = (comp_infec_between_countries, infec_stat_all_countries)
 
 
 """ Test Code: Single-Infection Visualizers """
@@ -295,3 +566,15 @@ def nan_checker(data, infec, stat, continent):
 # in Africa and Europe.
 # multi_comp(infec_df, 'COVID19', 'HIV', 'Africa', 'North America', 'est_total_deaths')
 
+# Test 5: Displays a grouped bar graph of deaths per million from every infection in every continent.
+# multi_comp_grid(infec_df, 'deaths_per_million')
+
+
+""" Test Code: Dashboards """
+
+# Test 1: Displays total deaths and total cases in the United States, Canada and Mexico, next to COVID-19 cases per
+# million in Africa and North America, as three panels of one figure.
+# dashboard(covid_df, [{'visualizer': 'v1', 'args': ['total_deaths', 'USA', 'CAN', 'MEX']},
+#                      {'visualizer': 'v1', 'args': ['total_cases', 'USA', 'CAN', 'MEX']},
+#                      {'visualizer': 'v4', 'args': ['COVID19', 'Africa', 'North America',
+#                                                    'total_cases_per_million']}], title="North America")